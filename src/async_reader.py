@@ -0,0 +1,187 @@
+import asyncio
+import struct
+import sys
+
+import serial
+
+from config import ReaderConstants, Results
+from reader import CommunicationHandler, CompensationHandler
+
+
+class AsyncSerial:
+    """
+    Class wrapping serial port for asyncio - requests can be sent by many coroutines at once,
+    responses are matched to requests in order they were sent. Timeout or partial frame resynchronizes
+    the link - all pending requests are resent in order, request failing RETRIES times gets TimeoutError
+    """
+    def __init__(self, serial_port: serial.Serial):
+        self.serial_port = serial_port
+        self.pending = asyncio.Queue()
+        self.link_ready = asyncio.Event()
+        self.link_ready.set()
+        self.timeouts = 0
+        self.partial_frames = 0
+        self.retries = 0
+        self.receiver = asyncio.get_running_loop().create_task(self.receive())
+
+    create_message = staticmethod(CommunicationHandler.create_ascii_message)
+
+    async def request(self, message: bytes, size: int) -> bytes:
+        """
+        Send message without waiting for previous responses and wait for its own response
+        :param: message (bytes) message compliant to the protocol
+        :param: size (int) expected response size in bytes
+        :return: response
+        :rtype: bytes
+        """
+        await self.link_ready.wait()
+        future = asyncio.get_running_loop().create_future()
+        # Queueing and writing happen without await in between, so order of queue matches order on the link
+        self.pending.put_nowait((message, size, future, 0))
+        self.serial_port.write(message)
+        return await future
+
+    async def receive(self) -> None:
+        """
+        Read responses (in executor, without blocking event loop) and pass them to waiting requests
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            message, size, future, attempt = await self.pending.get()
+            timeout = ReaderConstants.READ_TIMEOUT + size * ReaderConstants.BITS_PER_BYTE / ReaderConstants.BAUD_RATE
+            self.serial_port.timeout = timeout
+            response = await loop.run_in_executor(None, self.serial_port.read, size)
+            if len(response) == size:
+                if not future.done():
+                    future.set_result(response)
+                continue
+            if len(response) == 0:
+                self.timeouts += 1
+            else:
+                self.partial_frames += 1
+            await self.resynchronize((message, size, future, attempt + 1))
+
+    def drain(self) -> None:
+        """
+        Read and drop responses until link is quiet (responses to requests still in transmission included)
+        :return: None
+        """
+        self.serial_port.timeout = ReaderConstants.READ_TIMEOUT
+        while self.serial_port.read(max(self.serial_port.in_waiting, 1)):
+            pass
+        self.serial_port.reset_input_buffer()
+
+    async def resynchronize(self, failed: tuple) -> None:
+        """
+        Drop everything on the link and resend failed request and all requests pending after it in order,
+        new requests wait until it is done
+        :param: failed (tuple) message, response size, future and number of attempts of failed request
+        :return: None
+        """
+        self.link_ready.clear()
+        await asyncio.get_running_loop().run_in_executor(None, self.drain)
+        requests = [failed]
+        while not self.pending.empty():
+            requests.append(self.pending.get_nowait())
+        for index, (message, size, future, attempt) in enumerate(requests):
+            if future.done():
+                continue
+            if attempt > ReaderConstants.RETRIES:
+                future.set_exception(TimeoutError(f'No complete response to {message!r} after {attempt} attempts'))
+                continue
+            if index == 0:
+                self.retries += 1
+            self.pending.put_nowait((message, size, future, attempt))
+            self.serial_port.write(message)
+        self.link_ready.set()
+
+    async def handle_batch(self, messages: list) -> list:
+        """
+        Handle several messages in one frame (one packed voltage per message is returned)
+        :param: messages (list) messages compliant to the protocol
+        :return: responses from other module
+        :rtype: list
+        """
+        size = ReaderConstants.VOLTAGE_SIZE * len(messages)
+        if ReaderConstants.BATCH_MODE:
+            response = await self.request(CommunicationHandler.create_batch_message(messages), size)
+        else:
+            response = b''.join([await self.request(message, ReaderConstants.VOLTAGE_SIZE) for message in messages])
+        return list(struct.unpack('!%df' % len(messages), response))
+
+    async def close(self) -> None:
+        """
+        Stop receiving and close serial port
+        :return: None
+        """
+        self.receiver.cancel()
+        self.serial_port.write(b'q\n')
+        self.serial_port.close()
+
+
+class AsyncCompensationHandler:
+    """
+    Class handling compensation of one channel as a coroutine (state is kept per channel),
+    algorithm is the same as in reader (CompensationHandler.search)
+    """
+    def __init__(self, link: AsyncSerial, channel: str):
+        self.link = link
+        self.channel = channel
+        self.handler = CompensationHandler(link, channel)
+        self.pwm_left = self.handler.pwm_left
+        self.pwm_right = self.handler.pwm_right
+        self.pwm1, self.pwm2, self.step = CompensationHandler.initial_position()
+
+    async def compensate(self) -> float:
+        """
+        Compensate (find minimum) algorithm for this channel
+        Every batch starts with PWM command of this channel, so responses are never mixed with other channels
+        :return: final voltage
+        :rtype: float
+        """
+        search = self.handler.search((self.pwm1, self.pwm2, self.step))
+        voltages = None
+        try:
+            while True:
+                voltages = await self.link.handle_batch(search.send(voltages))
+        except StopIteration as stop:
+            _, self.pwm1, self.pwm2 = stop.value
+        create = self.link.create_message
+        voltage = (await self.link.handle_batch([create(self.pwm_left, self.pwm1),
+                                                 create(self.pwm_right, self.pwm2)]))[-1]
+
+        Results.RESULTS[self.pwm_left] = self.pwm1
+        Results.RESULTS[self.pwm_right] = self.pwm2
+        Results.RESULT_VOLTAGE[self.channel] = voltage
+        return voltage
+
+
+async def compensate_all(serial_port: serial.Serial) -> dict:
+    """
+    Compensate all channels concurrently on one shared link
+    :param: serial_port (serial.Serial) opened serial port
+    :return: final voltage for every channel
+    :rtype: dict
+    """
+    link = AsyncSerial(serial_port)
+    handlers = [AsyncCompensationHandler(link, channel) for channel in ReaderConstants.CHANNELS_LIST]
+    try:
+        voltages = await asyncio.gather(*[handler.compensate() for handler in handlers])
+    finally:
+        await link.close()
+    return dict(zip(ReaderConstants.CHANNELS_LIST, voltages))
+
+
+if __name__ == '__main__':
+    port = serial.Serial(port=ReaderConstants.COM_PORT,
+                         baudrate=ReaderConstants.BAUD_RATE,
+                         timeout=ReaderConstants.READ_TIMEOUT)
+    results = asyncio.run(compensate_all(port))
+    for channel_name, final_voltage in results.items():
+        pwm_left, pwm_right = ReaderConstants.CHANNEL_PWM_DICT[channel_name]
+        print(f'Channel number: [{channel_name}]')
+        print(f'Final voltage: [{final_voltage}][V]')
+        print(f'PWM channel {pwm_left}: [{Results.RESULTS[pwm_left]}]')
+        print(f'PWM channel {pwm_right}: [{Results.RESULTS[pwm_right]}]')
+    sys.exit()
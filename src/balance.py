@@ -0,0 +1,47 @@
+from config import BridgeConstants
+
+
+class BalanceSolver:
+    """
+    Class solving Maxwell-Wien bridge balance condition analytically
+    Z1 * Z4 = Z2 * Z3, where Z1 = R1, Z2 = R3 + jwL, Z3 = R2 || C, Z4 = R4 gives:
+    R1 = L / (C * R4), R2 = L / (C * R3) (balance does not depend on frequency)
+    """
+    def __init__(self, capacitance: float = BridgeConstants.CAPACITANCE,
+                 resistance3: float = BridgeConstants.RESISTANCE3,
+                 resistance4: float = BridgeConstants.RESISTANCE4,
+                 inductance: float = BridgeConstants.INDUCTANCE):
+        self.C = capacitance
+        self.R3 = resistance3
+        self.R4 = resistance4
+        self.L = inductance
+
+    def resistances(self) -> tuple:
+        """
+        Get ideal resistances of both potentiometers
+        :return: resistance of potentiometer1 and potentiometer2
+        :rtype: tuple
+        """
+        return self.L / (self.C * self.R4), self.L / (self.C * self.R3)
+
+    @staticmethod
+    def resistance_to_pwm(resistance: float) -> int:
+        """
+        Map resistance back to PWM value (inverse of Potentiometer and PWM.map_pwm), clamped to PWM range
+        :param: resistance (float)
+        :return: PWM value
+        :rtype: int
+        """
+        position = 100 * (resistance - BridgeConstants.MIN_RESISTANCE) \
+            / (BridgeConstants.MAX_RESISTANCE - BridgeConstants.MIN_RESISTANCE)
+        pwm = BridgeConstants.PWM_MIN + position * (BridgeConstants.PWM_MAX - BridgeConstants.PWM_MIN) / 100
+        return int(min(max(round(pwm), BridgeConstants.PWM_MIN), BridgeConstants.PWM_MAX))
+
+    def pwms(self) -> tuple:
+        """
+        Get PWM pair balancing the bridge
+        :return: left and right PWM value
+        :rtype: tuple
+        """
+        resistance1, resistance2 = self.resistances()
+        return self.resistance_to_pwm(resistance1), self.resistance_to_pwm(resistance2)
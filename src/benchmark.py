@@ -0,0 +1,136 @@
+import itertools
+import json
+import math
+import platform
+import sys
+import time
+
+from bridge_simulator import MaxwellWienBridge, PWM, MessageHandler
+from config import BridgeConstants, ReaderConstants, BenchmarkConstants
+from measurement_cache import MeasurementCache
+from reader import CommunicationHandler, CompensationHandler
+from transport import InMemorySerial, LinkModel
+
+
+class BenchmarkRunner:
+    """
+    Class running reader compensation against in-process simulator (no serial port needed)
+    """
+    # Reader settings modified by benchmark cases, restored after every case
+    SETTINGS = ('INITIAL_PWM', 'WARM_START', 'WARM_START_STEP', 'STEP1', 'OPTIMIZER')
+
+    def __init__(self):
+        self.defaults = {name: getattr(ReaderConstants, name) for name in self.SETTINGS}
+        self.results = []
+
+    def restore_settings(self) -> None:
+        """
+        Restore reader settings changed by benchmark case
+        :return: None
+        """
+        for name, value in self.defaults.items():
+            setattr(ReaderConstants, name, value)
+
+    def run_case(self, factors: tuple, initial_pwm, step: float, optimizer, cache: bool) -> dict:
+        """
+        Run one compensation and measure it
+        :param: factors (tuple) multipliers of nominal C, R3, R4, L (component tolerances)
+        :param: initial_pwm (tuple | None) starting point, None for warm start from balance point
+        :param: step (float) initial step
+        :param: optimizer (str | None) optimizer engine name, None for built-in probing
+        :param: cache (bool) use measurement cache
+        :return: case description and results
+        :rtype: dict
+        """
+        bridge = MaxwellWienBridge(BridgeConstants.CAPACITANCE * factors[0],
+                                   BridgeConstants.RESISTANCE3 * factors[1],
+                                   BridgeConstants.RESISTANCE4 * factors[2],
+                                   BridgeConstants.INDUCTANCE * factors[3],
+                                   BridgeConstants.FREQUENCY)
+        pwm_handler = PWM(bridge)
+        port = InMemorySerial(MessageHandler(pwm_handler), LinkModel(drop_rate=0, seed=0))
+        comm = CommunicationHandler(port)
+        if cache:
+            comm = MeasurementCache(comm)
+
+        ReaderConstants.INITIAL_PWM = initial_pwm
+        ReaderConstants.WARM_START = initial_pwm is None
+        ReaderConstants.WARM_START_STEP = step
+        ReaderConstants.STEP1 = step
+        ReaderConstants.OPTIMIZER = optimizer
+        try:
+            start = time.perf_counter()
+            handler = CompensationHandler(comm, verbose=False)
+            voltage = handler.find_minimum()
+            wall_time = time.perf_counter() - start
+            pwm1, pwm2 = handler.pwm1, handler.pwm2
+        finally:
+            self.restore_settings()
+
+        target_pwm1, target_pwm2 = bridge.balance_pwms()
+        return {
+            'factors': list(factors),
+            'initial_pwm': list(initial_pwm) if initial_pwm is not None else None,
+            'step': step,
+            'optimizer': optimizer,
+            'cache': cache,
+            'round_trips': port.frames,
+            'bytes_sent': port.bytes_sent,
+            'bytes_received': port.bytes_received,
+            'wall_time': wall_time,
+            'link_time': port.link_time,
+            'final_voltage': voltage,
+            'final_pwm': [pwm1, pwm2],
+            'balance_pwm': [target_pwm1, target_pwm2],
+            'pwm_error': math.hypot(pwm1 - target_pwm1, pwm2 - target_pwm2),
+        }
+
+    def run(self) -> list:
+        """
+        Run all combinations of settings from BenchmarkConstants
+        :return: results of all cases
+        :rtype: list
+        """
+        for case in itertools.product(BenchmarkConstants.COMPONENT_FACTORS, BenchmarkConstants.INITIAL_PWMS,
+                                      BenchmarkConstants.STEPS, BenchmarkConstants.OPTIMIZERS,
+                                      BenchmarkConstants.CACHE):
+            self.results.append(self.run_case(*case))
+        return self.results
+
+    def summary(self) -> dict:
+        """
+        Aggregate results per optimizer and cache setting
+        :return: mean round-trips, wall time, modelled link time, final voltage and PWM error
+        :rtype: dict
+        """
+        groups = {}
+        for result in self.results:
+            name = f'{result["optimizer"] or "coordinate"}{"+cache" if result["cache"] else ""}'
+            groups.setdefault(name, []).append(result)
+        return {name: {key: sum(result[key] for result in group) / len(group)
+                       for key in ('round_trips', 'wall_time', 'link_time', 'final_voltage', 'pwm_error')}
+                for name, group in groups.items()}
+
+    def save(self, path: str) -> None:
+        """
+        Save results as JSON
+        :param: path (str) output file
+        :return: None
+        """
+        report = {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'summary': self.summary(),
+            'results': self.results,
+        }
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    output_file = sys.argv[1] if len(sys.argv) > 1 else BenchmarkConstants.OUTPUT_FILE
+    runner = BenchmarkRunner()
+    runner.run()
+    runner.save(output_file)
+    for group_name, values in runner.summary().items():
+        print(f'{group_name}: {values}')
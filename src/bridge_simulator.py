@@ -2,10 +2,34 @@ import math
 import cmath
 import struct
 import sys
+import time
 
+import numpy as np
 import serial
 
+from balance import BalanceSolver
 from config import BridgeConstants, ReaderConstants
+from instrumentation import METRICS
+from optimizers import Optimizer, OptimizationResult
+from protocol import BinaryProtocol
+from transport import LinkModel
+
+
+def _component(name: str) -> property:
+    """
+    Create property for bridge component which invalidates frequency-only cache on change
+    :param: name (str) name of the attribute
+    :return: property
+    :rtype: property
+    """
+    def getter(self):
+        return getattr(self, '_' + name)
+
+    def setter(self, value):
+        setattr(self, '_' + name, value)
+        self.invalidate_cache()
+
+    return property(getter, setter)
 
 
 class MaxwellWienBridge:
@@ -21,30 +45,74 @@ class MaxwellWienBridge:
     Z_C: complex
     Z3: complex
     Z4: complex
+    v1: complex
+
+    C = _component('C')
+    R3 = _component('R3')
+    R4 = _component('R4')
+    L = _component('L')
+    frequency = _component('frequency')
 
     def __init__(self, capacitance, resistance3, resistance4, inductance, frequency):
+        self._cache_valid = False
+        self._surface_index = None
         self.C = capacitance
         self.R3 = resistance3
         self.R4 = resistance4
         self.L = inductance
         self.frequency = frequency
-        self.potentiometer1 = Potentiometer()
-        self.potentiometer2 = Potentiometer()
+        self.potentiometer1 = Potentiometer(on_change=self.update_z1)
+        self.potentiometer2 = Potentiometer(on_change=self.update_z3)
 
-    def calculate_impedance(self) -> None:
+    def invalidate_cache(self) -> None:
         """
-        Recalculate impedance
-        (Algorithm based on one given during lecture)
+        Mark terms depending only on frequency and component values (and voltage surface index) as outdated
+        :return: None
+        """
+        self._cache_valid = False
+        self._surface_index = None
+
+    def calculate_frequency_terms(self) -> None:
+        """
+        Recalculate (and cache) terms which do not depend on potentiometers
         :return: None
         """
         self.omega = 2 * math.pi * self.frequency
-        self.Z1 = complex(self.potentiometer1.resistance, 0)
         self.Z2 = complex(self.R3, self.omega * self.L)
-        Z_R2 = complex(self.potentiometer2.resistance, 0)
-        Z_C = complex(0, (-1 / (self.omega * self.C)))
-        self.Z3 = ((Z_R2 * Z_C) / (Z_R2 + Z_C))
+        self.Z_C = complex(0, (-1 / (self.omega * self.C)))
         self.Z4 = complex(self.R4, 0)
+        self.v1 = (BridgeConstants.VOLTAGE * self.Z4) / (self.Z2 + self.Z4)
+        self._cache_valid = True
+        self.update_z1()
+        self.update_z3()
+
+    def update_z1(self) -> None:
+        """
+        Update Z1 after potentiometer1 changed its position
+        :return: None
+        """
+        self.Z1 = complex(self.potentiometer1.resistance, 0)
 
+    def update_z3(self) -> None:
+        """
+        Update parallel R2||C term after potentiometer2 changed its position
+        :return: None
+        """
+        if not self._cache_valid:
+            return
+        self.Z_R2 = complex(self.potentiometer2.resistance, 0)
+        self.Z3 = ((self.Z_R2 * self.Z_C) / (self.Z_R2 + self.Z_C))
+
+    def calculate_impedance(self) -> None:
+        """
+        Recalculate impedance
+        (Algorithm based on one given during lecture)
+        :return: None
+        """
+        if not self._cache_valid:
+            self.calculate_frequency_terms()
+
+    @METRICS.timed('bridge.get_voltage')
     def get_voltage(self) -> float:
         """
         Get current input offset voltage of chosen MW Bridge
@@ -52,17 +120,53 @@ class MaxwellWienBridge:
         :rtype: float
         """
         self.calculate_impedance()
-        v1 = (BridgeConstants.VOLTAGE * self.Z4) / (self.Z2 + self.Z4)
         v2 = (BridgeConstants.VOLTAGE * self.Z3) / (self.Z1 + self.Z3)
-        return cmath.polar(v2 - v1)[0]
+        return cmath.polar(v2 - self.v1)[0]
+
+    def balance_pwms(self) -> tuple:
+        """
+        Get PWM pair balancing the bridge, solved analytically from component values
+        :return: left and right PWM value
+        :rtype: tuple
+        """
+        return BalanceSolver(self.C, self.R3, self.R4, self.L).pwms()
+
+    def surface_index(self):
+        """
+        Get index of voltage surface, built on first use after component values or frequency changed
+        :return: voltage surface index
+        :rtype: VoltageSurfaceIndex
+        """
+        if self._surface_index is None:
+            self._surface_index = VoltageSurfaceIndex(self.get_voltage_grid)
+        return self._surface_index
+
+    def get_voltage_grid(self, pwm1_array, pwm2_array) -> np.ndarray:
+        """
+        Get input offset voltage for whole arrays of PWM values in one call
+        (Same chain as get_voltage: PWM -> position -> resistance -> Z1..Z4 -> |v2 - v1|)
+        :param: pwm1_array (array_like) PWM values of left potentiometer
+        :param: pwm2_array (array_like) PWM values of right potentiometer
+        :return: input offset voltages, shape of broadcast pwm1_array and pwm2_array
+        :rtype: np.ndarray
+        """
+        resistance1 = Potentiometer.position_to_resistance(PWM.map_pwm_array(pwm1_array))
+        resistance2 = Potentiometer.position_to_resistance(PWM.map_pwm_array(pwm2_array))
+        self.calculate_impedance()
+        Z1 = resistance1.astype(np.complex128)
+        Z3 = (resistance2 * self.Z_C) / (resistance2 + self.Z_C)
+        v2 = (BridgeConstants.VOLTAGE * Z3) / (Z1 + Z3)
+        return np.abs(v2 - self.v1)
 
 
 class Potentiometer:
     position: int
     resistance: int
 
-    def __init__(self) -> None:
+    def __init__(self, on_change=None) -> None:
+        self.on_change = None
         self.set_position(50)
+        self.on_change = on_change
 
     def set_position(self, pos: int) -> None:
         """
@@ -75,11 +179,22 @@ class Potentiometer:
 
         elif pos > 100:
             raise ValueError('Position value too high! Should be in range 0-100')
-        
+
         self.position = pos
-        self.resistance = ((BridgeConstants.MAX_RESISTANCE - BridgeConstants.MIN_RESISTANCE)
-                           * self.position / 100) + BridgeConstants.MIN_RESISTANCE
-        
+        self.resistance = self.position_to_resistance(self.position)
+        if self.on_change is not None:
+            self.on_change()
+
+    @staticmethod
+    def position_to_resistance(pos):
+        """
+        Convert position given in percents into resistance (works for scalars and arrays)
+        :param: pos (int | np.ndarray) position in scale 0-100
+        :return: resistance
+        """
+        return ((BridgeConstants.MAX_RESISTANCE - BridgeConstants.MIN_RESISTANCE)
+                * pos / 100) + BridgeConstants.MIN_RESISTANCE
+
     def get_resistance(self) -> int:
         """
         Get current resistance
@@ -129,6 +244,14 @@ class PWM:
             self.pwm2 = new_pwm
             self.bridge.potentiometer2.set_position(self.map_pwm(new_pwm))
 
+    def get_voltage(self) -> float:
+        """
+        Get current input offset voltage of the bridge
+        :return: input offset voltage
+        :rtype: float
+        """
+        return self.bridge.get_voltage()
+
     @staticmethod
     def map_pwm(pwm_i: int) -> int:
         """
@@ -145,6 +268,273 @@ class PWM:
             res = 100 * (pwm_i - BridgeConstants.PWM_MIN) / (BridgeConstants.PWM_MAX - BridgeConstants.PWM_MIN)
         return res
 
+    @staticmethod
+    def map_pwm_array(pwm_array) -> np.ndarray:
+        """
+        Map array of PWM values into scale 0-100 for potentiometer (vectorized map_pwm)
+        :param: pwm_array (array_like)
+        :return: pwm values in scale 0-100
+        :rtype: np.ndarray
+        """
+        pwm_array = np.asarray(pwm_array, dtype=np.float64)
+        res = 100 * (pwm_array - BridgeConstants.PWM_MIN) / (BridgeConstants.PWM_MAX - BridgeConstants.PWM_MIN)
+        return np.clip(res, 0, 100)
+
+
+class VoltageSurfaceIndex:
+    """
+    Class indexing voltage surface of one bridge over PWM domain - coarse grid of whole domain is stored as array
+    (with its argmin), minimum is then refined locally with finer steps (SURFACE_STEPS)
+    """
+    def __init__(self, voltage_grid, steps: tuple = BridgeConstants.SURFACE_STEPS):
+        """
+        :param: voltage_grid (callable) voltages for broadcast arrays of left and right PWM values
+        :param: steps (tuple) PWM step of coarse grid followed by steps of refinement
+        """
+        self.voltage_grid = voltage_grid
+        self.steps = steps
+        self.pwms = np.append(np.arange(BridgeConstants.PWM_MIN, BridgeConstants.PWM_MAX, steps[0]),
+                              BridgeConstants.PWM_MAX)
+        self.surface = voltage_grid(self.pwms[:, np.newaxis], self.pwms[np.newaxis, :])
+        row, column = np.unravel_index(np.argmin(self.surface), self.surface.shape)
+        self.coarse = (int(self.pwms[row]), int(self.pwms[column]), float(self.surface[row, column]))
+        self.fine = None
+
+    def lookup(self, pwm1: int, pwm2: int) -> float:
+        """
+        Get voltage of nearest coarse grid point
+        :param: pwm1 (int) left PWM value
+        :param: pwm2 (int) right PWM value
+        :return: voltage
+        :rtype: float
+        """
+        row = int(np.clip(round((pwm1 - BridgeConstants.PWM_MIN) / self.steps[0]), 0, len(self.pwms) - 1))
+        column = int(np.clip(round((pwm2 - BridgeConstants.PWM_MIN) / self.steps[0]), 0, len(self.pwms) - 1))
+        return float(self.surface[row, column])
+
+    @staticmethod
+    def window(center: int, radius: int, step: int) -> np.ndarray:
+        """
+        Get PWM values around center, limited to PWM range
+        :param: center (int)
+        :param: radius (int)
+        :param: step (int)
+        :return: PWM values
+        :rtype: np.ndarray
+        """
+        return np.unique(np.clip(np.arange(center - radius, center + radius + 1, step),
+                                 BridgeConstants.PWM_MIN, BridgeConstants.PWM_MAX))
+
+    @classmethod
+    def descend(cls, voltage_grid, pwm1: int, pwm2: int, voltage: float, steps: tuple) -> tuple:
+        """
+        Refine minimum from given point - every level searches neighbourhood of current minimum with smaller step,
+        neighbourhood is moved until its centre is the best point (follows narrow valley of the surface).
+        Before leaving a level, neighbourhood is enlarged up to first radius (valley may pass between grid points)
+        :param: voltage_grid (callable) voltages for broadcast arrays of left and right PWM values
+        :param: pwm1 (int) left PWM value of starting point
+        :param: pwm2 (int) right PWM value of starting point
+        :param: voltage (float) voltage of starting point
+        :param: steps (tuple) step of starting point (radius of first neighbourhood) followed by refinement steps
+        :return: left PWM value, right PWM value and voltage
+        :rtype: tuple
+        """
+        for level_radius, step in zip(steps, steps[1:]):
+            radius = level_radius
+            while radius <= steps[0]:
+                pwms1 = cls.window(pwm1, radius, step)
+                pwms2 = cls.window(pwm2, radius, step)
+                voltages = voltage_grid(pwms1[:, np.newaxis], pwms2[np.newaxis, :])
+                row, column = np.unravel_index(np.argmin(voltages), voltages.shape)
+                if voltages[row, column] >= voltage:
+                    radius *= 2
+                    continue
+                pwm1, pwm2, voltage = int(pwms1[row]), int(pwms2[column]), float(voltages[row, column])
+                radius = level_radius
+        return pwm1, pwm2, voltage
+
+    def refine(self) -> tuple:
+        """
+        Refine coarse minimum with finer steps
+        :return: left PWM value, right PWM value and voltage
+        :rtype: tuple
+        """
+        return self.descend(self.voltage_grid, *self.coarse, self.steps)
+
+    def minimum(self) -> tuple:
+        """
+        Get minimum of voltage surface (refined on first call)
+        :return: left PWM value, right PWM value and voltage
+        :rtype: tuple
+        """
+        if self.fine is None:
+            self.fine = self.refine()
+        return self.fine
+
+
+class BridgeBank:
+    """
+    Class computing voltages of any number of independent bridges at once
+    Component values are stored in arrays (one row per bridge), so voltages of all bridges are computed in one
+    vectorized operation (e.g. Monte Carlo samples or frequencies of a sweep)
+    """
+    def __init__(self, components: list):
+        """
+        :param: components (list) (C, R3, R4, L, frequency) for every bridge
+        """
+        components = np.asarray(components, dtype=np.float64).reshape(-1, 5)
+        self.C, self.R3, self.R4, self.L, self.frequency = components.T.copy()
+        self.calculate_frequency_terms()
+
+    def __len__(self) -> int:
+        """
+        Get number of bridges
+        :return: number of bridges
+        :rtype: int
+        """
+        return len(self.C)
+
+    def calculate_frequency_terms(self) -> None:
+        """
+        Recalculate (and cache) terms which do not depend on potentiometers, for all bridges
+        :return: None
+        """
+        omega = 2 * math.pi * self.frequency
+        Z2 = self.R3 + 1j * omega * self.L
+        self.Z_C = -1j / (omega * self.C)
+        self.v1 = (BridgeConstants.VOLTAGE * self.R4) / (Z2 + self.R4)
+
+    @METRICS.timed('bridge.get_voltage_grid')
+    def get_voltage_grid(self, pwms) -> np.ndarray:
+        """
+        Get input offset voltages of all bridges for arrays of PWM values
+        :param: pwms (array_like) shape (..., bridges, 2) - left and right PWM of every bridge
+        :return: input offset voltages, shape (..., bridges)
+        :rtype: np.ndarray
+        """
+        pwms = np.asarray(pwms, dtype=np.float64)
+        resistance1 = Potentiometer.position_to_resistance(PWM.map_pwm_array(pwms[..., 0]))
+        resistance2 = Potentiometer.position_to_resistance(PWM.map_pwm_array(pwms[..., 1]))
+        Z3 = (resistance2 * self.Z_C) / (resistance2 + self.Z_C)
+        v2 = (BridgeConstants.VOLTAGE * Z3) / (resistance1 + Z3)
+        return np.abs(v2 - self.v1)
+
+    def get_channel_voltage_grid(self, index: int, pwm1_array, pwm2_array) -> np.ndarray:
+        """
+        Get input offset voltage of one bridge for whole arrays of PWM values
+        :param: index (int) index of bridge
+        :param: pwm1_array (array_like) PWM values of left potentiometer
+        :param: pwm2_array (array_like) PWM values of right potentiometer
+        :return: input offset voltages, shape of broadcast pwm1_array and pwm2_array
+        :rtype: np.ndarray
+        """
+        resistance1 = Potentiometer.position_to_resistance(PWM.map_pwm_array(pwm1_array))
+        resistance2 = Potentiometer.position_to_resistance(PWM.map_pwm_array(pwm2_array))
+        Z_C = self.Z_C[index]
+        Z3 = (resistance2 * Z_C) / (resistance2 + Z_C)
+        v2 = (BridgeConstants.VOLTAGE * Z3) / (resistance1 + Z3)
+        return np.abs(v2 - self.v1[index])
+
+
+class MultiBridgeSimulator(BridgeBank):
+    """
+    Class to simulate four independent bridges (one per channel) driven by eight PWMs
+    Component values and PWMs are stored in arrays, so voltages of all channels are computed at once
+    """
+    def __init__(self, components: list):
+        """
+        :param: components (list) (C, R3, R4, L, frequency) for every channel from CHANNELS_LIST
+        """
+        self.channels = list(ReaderConstants.CHANNELS_LIST)
+        self.surface_indexes = {}
+        super().__init__(components)
+        if len(self) != len(self.channels):
+            raise ValueError(f'Components of {len(self)} bridges given, simulator has {len(self.channels)} channels!'
+                             f' (use BridgeBank for any number of bridges)')
+        self.pwm_index = {pwm: (channel_index, side)
+                          for channel_index, channel in enumerate(self.channels)
+                          for side, pwm in enumerate(ReaderConstants.CHANNEL_PWM_DICT[channel])}
+        initial_pwm = int((BridgeConstants.PWM_MIN + BridgeConstants.PWM_MAX) / 2)
+        self.pwms = np.full((len(self.channels), 2), initial_pwm, dtype=np.float64)
+        self.active_channel = 0
+
+    @classmethod
+    def from_constants(cls):
+        """
+        Create simulator with nominal components from BridgeConstants and tolerances of every channel
+        :return: simulator
+        :rtype: MultiBridgeSimulator
+        """
+        nominal = np.array([BridgeConstants.CAPACITANCE, BridgeConstants.RESISTANCE3, BridgeConstants.RESISTANCE4,
+                            BridgeConstants.INDUCTANCE])
+        components = [[*(nominal * BridgeConstants.CHANNEL_TOLERANCES[channel]), BridgeConstants.FREQUENCY]
+                      for channel in ReaderConstants.CHANNELS_LIST]
+        return cls(components)
+
+    def calculate_frequency_terms(self) -> None:
+        """
+        Recalculate (and cache) terms which do not depend on potentiometers, surface indexes are built again
+        :return: None
+        """
+        super().calculate_frequency_terms()
+        self.surface_indexes = {}
+
+    def set_components(self, channel: str, capacitance: float, resistance3: float, resistance4: float,
+                       inductance: float, frequency: float) -> None:
+        """
+        Change component values of one bridge
+        :param: channel (str)
+        :return: None
+        """
+        index = self.channels.index(channel)
+        self.C[index], self.R3[index], self.R4[index] = capacitance, resistance3, resistance4
+        self.L[index], self.frequency[index] = inductance, frequency
+        self.calculate_frequency_terms()
+
+    def set_pwm(self, pwm_name: str, pwm_value: int) -> None:
+        """
+        Set PWM value, routed to bridge by CHANNEL_PWM_DICT (ValueError is raised for unknown PWM name)
+        :param: pwm_name (str)
+        :param: pwm_value (int)
+        :return: None
+        """
+        if pwm_name not in self.pwm_index:
+            raise ValueError(f'Unknown PWM {pwm_name!r}! Should be one of: {", ".join(self.pwm_index)}')
+        channel_index, side = self.pwm_index[pwm_name]
+        self.pwms[channel_index, side] = PWM.check_pwm(pwm_value)
+        self.active_channel = channel_index
+
+    def surface_index(self, channel: str) -> VoltageSurfaceIndex:
+        """
+        Get index of voltage surface of chosen channel, built on first use after components changed
+        :param: channel (str)
+        :return: voltage surface index
+        :rtype: VoltageSurfaceIndex
+        """
+        if channel not in self.surface_indexes:
+            index = self.channels.index(channel)
+            self.surface_indexes[channel] = VoltageSurfaceIndex(
+                lambda pwm1, pwm2: self.get_channel_voltage_grid(index, pwm1, pwm2))
+        return self.surface_indexes[channel]
+
+    def get_voltages(self) -> np.ndarray:
+        """
+        Get current input offset voltages of all bridges (one vectorized operation)
+        :return: voltage for every channel
+        :rtype: np.ndarray
+        """
+        return self.get_voltage_grid(self.pwms)
+
+    def get_voltage(self, channel: str = None) -> float:
+        """
+        Get current input offset voltage of chosen channel (channel of last set PWM by default)
+        :param: channel (str)
+        :return: input offset voltage
+        :rtype: float
+        """
+        index = self.active_channel if channel is None else self.channels.index(channel)
+        return float(self.get_voltages()[index])
+
 
 class CompensationHandler:
     """
@@ -197,6 +587,246 @@ class CompensationHandler:
 
             voltage = self.pwm.bridge.get_voltage()
 
+    def optimize(self, channel_name: str, optimizer: Optimizer) -> OptimizationResult:
+        """
+        Compensate voltage of chosen channel with chosen optimizer engine
+        :param: channel_name (str)
+        :param: optimizer (Optimizer)
+        :return: result of minimization
+        :rtype: OptimizationResult
+        """
+        pwm_left = ReaderConstants.CHANNEL_PWM_DICT[channel_name][0]
+        pwm_right = ReaderConstants.CHANNEL_PWM_DICT[channel_name][1]
+
+        def measure(pwm1: int, pwm2: int) -> float:
+            self.pwm.set_pwm(pwm_left, pwm1)
+            self.pwm.set_pwm(pwm_right, pwm2)
+            return self.pwm.bridge.get_voltage()
+
+        result = optimizer.minimize(measure, self.pwm.pwm1, self.pwm.pwm2)
+        measure(result.pwm1, result.pwm2)
+        return result
+
+    def find_minimum(self, channel_name: str) -> float:
+        """
+        Set potentiometers of chosen channel to minimum found in voltage surface index (no walk over surface)
+        :param: channel_name (str)
+        :return: minimal voltage
+        :rtype: float
+        """
+        pwm_left = ReaderConstants.CHANNEL_PWM_DICT[channel_name][0]
+        pwm_right = ReaderConstants.CHANNEL_PWM_DICT[channel_name][1]
+        pwm1, pwm2, voltage = self.pwm.bridge.surface_index().minimum()
+        self.pwm.set_pwm(pwm_left, pwm1)
+        self.pwm.set_pwm(pwm_right, pwm2)
+        return voltage
+
+
+class MessageHandler:
+    """
+    Class to handle messages received from reader (single commands and batch frames)
+    """
+    def __init__(self, pwm_handle):
+        """
+        :param: pwm_handle (PWM | MultiBridgeSimulator) object providing set_pwm and get_voltage
+        """
+        self.pwm = pwm_handle
+        self.binary = False
+
+    def handle_command(self, command: str) -> float:
+        """
+        Execute single command (aXXXX, bXXXX, ..., v) and measure voltage
+        :param: command (str) command without newline byte
+        :return: voltage measured after executing command
+        :rtype: float
+        """
+        if command != 'v':
+            # Command may be preceded by voltage read (vaXXXX)
+            start = 1 if 'v' in command else 0
+            self.pwm.set_pwm(command[start], int(command[start + 1:start + 5]))
+        return self.pwm.get_voltage()
+
+    def handle_frame(self, frame: str) -> bytes:
+        """
+        Execute received frame and pack response
+        Batch frame (*aXXXX;bXXXX;v\n) is answered with one packed voltage per command,
+        any other frame is treated as single command
+        :param: frame (str) received frame including newline byte
+        :return: packed response
+        :rtype: bytes
+        """
+        frame = frame.rstrip('\n')
+        if frame == ReaderConstants.NEGOTIATE_MSG.decode('utf-8').rstrip('\n'):
+            self.binary = True
+            return ReaderConstants.BINARY_ACK
+        prefix = ReaderConstants.BATCH_PREFIX.decode('utf-8')
+        if frame.startswith(prefix):
+            separator = ReaderConstants.BATCH_SEPARATOR.decode('utf-8')
+            commands = frame[len(prefix):].split(separator)
+            voltages = [self.handle_command(command) for command in commands]
+            return struct.pack('!%df' % len(voltages), *voltages)
+        return struct.pack('!f', self.handle_command(frame))
+
+    def execute_binary(self, opcode: int, value: int) -> float:
+        """
+        Execute single binary command and measure voltage
+        :param: opcode (int) PWM name or 'v'
+        :param: value (int) PWM value
+        :return: voltage measured after executing command
+        :rtype: float
+        """
+        if opcode != BinaryProtocol.VOLTAGE:
+            self.pwm.set_pwm(chr(opcode), value)
+        return self.pwm.get_voltage()
+
+    def handle_binary(self, frame: bytes) -> bytes:
+        """
+        Execute received binary frame (single command or batch) and pack response
+        :param: frame (bytes)
+        :return: packed response, one voltage per command
+        :rtype: bytes
+        """
+        opcode, value = BinaryProtocol.decode(frame[:BinaryProtocol.SIZE])
+        if opcode != BinaryProtocol.BATCH:
+            return struct.pack('!f', self.execute_binary(opcode, value))
+        commands = [BinaryProtocol.decode(frame[start:start + BinaryProtocol.SIZE])
+                    for start in range(BinaryProtocol.SIZE, len(frame), BinaryProtocol.SIZE)]
+        voltages = [self.execute_binary(opcode, value) for opcode, value in commands]
+        return struct.pack('!%df' % len(voltages), *voltages)
+
+    @METRICS.timed('simulator.handle')
+    def handle(self, frame: bytes) -> bytes:
+        """
+        Execute received frame in currently negotiated protocol
+        :param: frame (bytes)
+        :return: packed response
+        :rtype: bytes
+        """
+        if self.binary:
+            return self.handle_binary(frame)
+        return self.handle_frame(frame.decode('utf-8'))
+
+    def frame_length(self, buffer) -> int:
+        """
+        Get length of first complete frame in buffer
+        :param: buffer (bytes)
+        :return: length, 0 if frame is not complete yet
+        :rtype: int
+        """
+        if self.binary:
+            return BinaryProtocol.frame_length(buffer)
+        if ReaderConstants.NEWLINE_B in buffer:
+            return buffer.index(ReaderConstants.NEWLINE_B) + 1
+        return 0
+
+    def is_quit(self, frame: bytes) -> bool:
+        """
+        Check if frame is quit message
+        :param: frame (bytes)
+        :return: True for quit message
+        :rtype: bool
+        """
+        if self.binary:
+            return frame[0] == BinaryProtocol.QUIT
+        return frame == b'q\n'
+
+
+class SerialServer:
+    """
+    Class to serve reader requests over serial port (blocking reads with timeout, no polling)
+    Optional LinkModel delays responses like real link at given baud rate and drops frames,
+    e.g. over virtual serial ports created with PyVirtualSerialPorts (python -m virtualserialports 2)
+    """
+    def __init__(self, serial_port: serial.Serial, message_handler: MessageHandler, link: LinkModel = None):
+        self.serial_port = serial_port
+        self.message_handler = message_handler
+        self.link = link
+        self.serial_port.timeout = BridgeConstants.READ_TIMEOUT
+        self.timeouts = 0
+        self.partial_frames = 0
+        self.malformed_frames = 0
+
+    def receive_binary_frame(self) -> bytes:
+        """
+        Wait for one complete binary frame (with batch commands)
+        :return: frame, empty bytes on timeout or partial frame
+        :rtype: bytes
+        """
+        frame = self.serial_port.read(BinaryProtocol.SIZE)
+        if len(frame) == BinaryProtocol.SIZE and frame[0] == BinaryProtocol.BATCH:
+            frame += self.serial_port.read(BinaryProtocol.SIZE * BinaryProtocol.FRAME.unpack(frame)[1])
+        if len(frame) == 0:
+            self.timeouts += 1
+            METRICS.count('simulator.timeouts')
+        elif BinaryProtocol.frame_length(frame) != len(frame):
+            self.partial_frames += 1
+            METRICS.count('simulator.partial_frames')
+            return b''
+        return frame
+
+    @METRICS.timed('simulator.wait')
+    def receive_frame(self) -> bytes:
+        """
+        Wait for one complete frame
+        :return: frame including newline byte, empty bytes on timeout or partial frame
+        :rtype: bytes
+        """
+        if self.message_handler.binary:
+            return self.receive_binary_frame()
+        frame = self.serial_port.read_until(ReaderConstants.NEWLINE_B)
+        if len(frame) == 0:
+            self.timeouts += 1
+            METRICS.count('simulator.timeouts')
+        elif not frame.endswith(ReaderConstants.NEWLINE_B):
+            self.partial_frames += 1
+            METRICS.count('simulator.partial_frames')
+            return b''
+        return frame
+
+    def serve(self) -> None:
+        """
+        Answer frames until quit message is received
+        :return: None
+        """
+        while True:
+            frame = self.receive_frame()
+            if not frame:
+                continue
+            METRICS.count('simulator.frames')
+            METRICS.count('simulator.bytes_received', len(frame))
+            if self.message_handler.is_quit(frame):
+                self.serial_port.close()
+                return
+            try:
+                response = self.message_handler.handle(frame)
+            except Exception:
+                # Malformed frame (wrong checksum, unknown command, ...) is not answered, server keeps running
+                self.malformed_frames += 1
+                METRICS.count('simulator.malformed_frames')
+                self.serial_port.reset_input_buffer()
+                continue
+            if self.link is None:
+                self.serial_port.write(response)
+            elif not self.link.drop():
+                self.write_delayed(len(frame), response)
+            else:
+                METRICS.count('simulator.dropped_frames')
+                continue
+            METRICS.count('simulator.bytes_sent', len(response))
+
+    def write_delayed(self, request_size: int, response: bytes) -> None:
+        """
+        Write response after modelled transmission and processing time, byte by byte at modelled baud rate
+        :param: request_size (int) size of request frame in bytes
+        :param: response (bytes)
+        :return: None
+        """
+        byte_time = self.link.byte_time()
+        time.sleep(request_size * byte_time + self.link.processing_time())
+        for i in range(len(response)):
+            time.sleep(byte_time)
+            self.serial_port.write(response[i:i + 1])
+
 
 def display_results(channel: str, pwm1: int, pwm1_name: str, pwm2: int, pwm2_name: str, resistance1: int,
                     resistance2: int, voltage: float) -> None:
@@ -209,41 +839,27 @@ def display_results(channel: str, pwm1: int, pwm1_name: str, pwm2: int, pwm2_nam
 
 
 if __name__ == '__main__':
+    METRICS.start_from_config()
     serial_port = serial.Serial(port=BridgeConstants.COM_PORT, baudrate=BridgeConstants.BAUD_RATE)
-    maxwell_bridge = MaxwellWienBridge(
-                BridgeConstants.CAPACITANCE,
-                BridgeConstants.RESISTANCE3,
-                BridgeConstants.RESISTANCE4,
-                BridgeConstants.INDUCTANCE,
-                BridgeConstants.FREQUENCY)
-    pwm_handler = PWM(maxwell_bridge)
-    initial_pwm = int((BridgeConstants.PWM_MIN + BridgeConstants.PWM_MAX) / 2)
-    chosen_pwms = ReaderConstants.CHANNEL_PWM_DICT[ReaderConstants.CHOSEN_CHANNEL]
-    for pwm in chosen_pwms:
-        pwm_handler.set_pwm(pwm, initial_pwm)
-
-    while True:
-        serial_port.reset_input_buffer()
-        while serial_port.in_waiting == 0:
-            pass
-
-        response = serial_port.read_until().decode('utf-8')
-        if response == 'v\n':
-            voltage = maxwell_bridge.get_voltage()
-            serial_port.reset_output_buffer()
-            serial_port.write(struct.pack('!f', voltage))
-        elif response != 'q\n':
-            tmp_msg = [*response]
-            if 'v' not in tmp_msg:
-                channel = tmp_msg[0]
-                pwm_value = int(''.join(tmp_msg[1:5]))
-            else:
-                channel = tmp_msg[1]
-                pwm_value = int(''.join(tmp_msg[2:6]))
-            pwm_handler.set_pwm(channel, pwm_value)
-            voltage = maxwell_bridge.get_voltage()
-            serial_port.reset_output_buffer()
-            serial_port.write(struct.pack('!f', voltage))
-        else:
-            serial_port.close()
-            sys.exit()
+    if BridgeConstants.MULTI_BRIDGE:
+        pwm_handler = MultiBridgeSimulator.from_constants()
+        for chosen_channel in ReaderConstants.CHANNELS_LIST:
+            pwm_handler.surface_index(chosen_channel)
+    else:
+        maxwell_bridge = MaxwellWienBridge(
+                    BridgeConstants.CAPACITANCE,
+                    BridgeConstants.RESISTANCE3,
+                    BridgeConstants.RESISTANCE4,
+                    BridgeConstants.INDUCTANCE,
+                    BridgeConstants.FREQUENCY)
+        pwm_handler = PWM(maxwell_bridge)
+        maxwell_bridge.surface_index()
+        initial_pwm = int((BridgeConstants.PWM_MIN + BridgeConstants.PWM_MAX) / 2)
+        chosen_pwms = ReaderConstants.CHANNEL_PWM_DICT[ReaderConstants.CHOSEN_CHANNEL]
+        for pwm in chosen_pwms:
+            pwm_handler.set_pwm(pwm, initial_pwm)
+
+    link_model = LinkModel() if BridgeConstants.SIMULATE_LINK else None
+    server = SerialServer(serial_port, MessageHandler(pwm_handler), link_model)
+    server.serve()
+    sys.exit()
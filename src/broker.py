@@ -0,0 +1,282 @@
+import os
+import queue
+import socketserver
+import struct
+import sys
+import threading
+
+import serial
+
+from config import ReaderConstants
+from instrumentation import METRICS
+from measurement_log import MeasurementLog
+from protocol import BinaryProtocol
+from reader import CommunicationHandler
+
+
+class BrokerRequest:
+    """
+    Class holding messages of one client request until they are answered
+    """
+    def __init__(self, messages: list):
+        self.messages = messages
+        self.voltages = None
+        self.done = threading.Event()
+
+
+class Broker:
+    """
+    Class owning connection to other module and executing requests of all clients one frame at a time.
+    Requests waiting in queue are merged into one batch frame (in order they came), voltage reads (v\\n)
+    are not sent at all when any command precedes them in the frame - they are answered with its voltage
+    """
+    def __init__(self, communication_handler: CommunicationHandler,
+                 max_batch: int = ReaderConstants.BROKER_MAX_BATCH):
+        self.comm = communication_handler
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        self.held = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.thread_function, daemon=True)
+        self.received_requests = 0
+        self.round_trips = 0
+        self.merged_reads = 0
+        self.failed_round_trips = 0
+        self.expired_requests = 0
+        self.rejected_requests = 0
+
+    def start(self) -> None:
+        """
+        Start executing requests in background thread
+        :return: None
+        """
+        self.thread.start()
+
+    @staticmethod
+    def valid_message(message: bytes) -> bool:
+        """
+        Check if message is a command other module understands - PWM name from PWMS_LIST followed by PWM value,
+        or voltage read
+        :param: message (bytes)
+        :return: True for valid message
+        :rtype: bool
+        """
+        if message == ReaderConstants.GET_VOLTAGE_MSG:
+            return True
+        if not message.endswith(ReaderConstants.NEWLINE_B) or chr(message[0]) not in ReaderConstants.PWMS_LIST:
+            return False
+        return message[1:-1].isdigit()
+
+    def reject(self, messages: list) -> list:
+        """
+        Answer request which is not forwarded to other module
+        :param: messages (list)
+        :return: NaN voltage for every message
+        :rtype: list
+        """
+        self.rejected_requests += 1
+        METRICS.count('broker.rejected_requests')
+        return [float('nan')] * len(messages)
+
+    def submit(self, messages: list, timeout: float = ReaderConstants.BROKER_REQUEST_TIMEOUT) -> list:
+        """
+        Queue messages of one request and wait for their voltages
+        :param: messages (list) messages compliant to the protocol
+        :param: timeout (float) [s] max time to wait for answer, None to wait forever
+        :return: voltages, one per message (NaN if other module did not answer in time)
+        :rtype: list
+        """
+        request = BrokerRequest(messages)
+        self.requests.put(request)
+        if not request.done.wait(timeout):
+            self.expired_requests += 1
+            METRICS.count('broker.expired_requests')
+            return [float('nan')] * len(messages)
+        return request.voltages
+
+    def collect(self) -> list:
+        """
+        Wait for request and take all requests queued after it which fit into one frame
+        :return: requests in order they came, empty list when stopped
+        :rtype: list
+        """
+        first = self.held if self.held is not None else self.requests.get()
+        self.held = None
+        if first is None:
+            return []
+        pending = [first]
+        size = len(first.messages)
+        while True:
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                break
+            if size + len(request.messages) > self.max_batch:
+                self.held = request
+                break
+            pending.append(request)
+            size += len(request.messages)
+        return pending
+
+    def merge(self, pending: list) -> tuple:
+        """
+        Merge messages of requests into one frame, reads following any command are answered by its voltage
+        :param: pending (list) requests
+        :return: messages to be sent and index of sent message answering every requested message
+        :rtype: tuple
+        """
+        messages = []
+        sources = []
+        for request in pending:
+            for message in request.messages:
+                if message == ReaderConstants.GET_VOLTAGE_MSG and messages:
+                    self.merged_reads += 1
+                    METRICS.count('broker.merged_reads')
+                else:
+                    messages.append(message)
+                sources.append(len(messages) - 1)
+        return messages, sources
+
+    def execute(self, pending: list) -> None:
+        """
+        Send merged requests in one round-trip and answer every request
+        :param: pending (list) requests
+        :return: None
+        """
+        messages, sources = self.merge(pending)
+        if self.comm.binary:
+            # Clients use ASCII protocol
+            messages = [BinaryProtocol.from_ascii(message) for message in messages]
+        try:
+            voltages = self.comm.handle_batch(messages)
+            self.round_trips += 1
+            METRICS.count('broker.round_trips')
+        except Exception as error:
+            # Any failure (also serial.SerialException) is answered with NaN, clients must not wait forever
+            print(f'Broker: frame failed: {error!r}', file=sys.stderr)
+            self.failed_round_trips += 1
+            METRICS.count('broker.failed_round_trips')
+            voltages = [float('nan')] * len(messages)
+        position = 0
+        for request in pending:
+            request.voltages = [voltages[source] for source in sources[position:position + len(request.messages)]]
+            position += len(request.messages)
+            request.done.set()
+
+    def thread_function(self) -> None:
+        """
+        Execute queued requests until stopped, run as a thread
+        :return: None
+        """
+        while not self.stop_event.is_set():
+            pending = self.collect()
+            if not pending:
+                continue
+            self.received_requests += len(pending)
+            self.execute(pending)
+
+    def stop(self) -> None:
+        """
+        Stop thread after currently executed frame, requests still queued are answered with NaN
+        :return: None
+        """
+        self.stop_event.set()
+        self.requests.put(None)
+        self.thread.join()
+        pending = [self.held] if self.held is not None else []
+        self.held = None
+        while not self.requests.empty():
+            pending.append(self.requests.get_nowait())
+        for request in pending:
+            if request is not None:
+                request.voltages = [float('nan')] * len(request.messages)
+                request.done.set()
+
+    def stats(self) -> dict:
+        """
+        Get broker statistics
+        :return: requests, round-trips, reads answered without sending them, failed round-trips,
+                 requests not answered in time and rejected requests
+        :rtype: dict
+        """
+        return {
+            'requests': self.received_requests,
+            'round_trips': self.round_trips,
+            'merged_reads': self.merged_reads,
+            'failed_round_trips': self.failed_round_trips,
+            'expired_requests': self.expired_requests,
+            'rejected_requests': self.rejected_requests
+        }
+
+
+class BrokerRequestHandler(socketserver.StreamRequestHandler):
+    """
+    Class serving one client - frames of the ASCII protocol (single, batch, negotiation, quit) are read
+    line by line and answered with packed voltages, as other module does
+    """
+    def handle(self) -> None:
+        broker = self.server.broker
+        for frame in self.rfile:
+            if frame == ReaderConstants.NEGOTIATE_MSG:
+                # Clients stay with ASCII protocol, broker converts frames for other module
+                self.wfile.write(ReaderConstants.ASCII_ACK)
+                continue
+            if frame == b'q\n':
+                return
+            if frame.startswith(ReaderConstants.BATCH_PREFIX):
+                commands = frame[len(ReaderConstants.BATCH_PREFIX):].rstrip(ReaderConstants.NEWLINE_B)
+                messages = [command + ReaderConstants.NEWLINE_B
+                            for command in commands.split(ReaderConstants.BATCH_SEPARATOR)]
+            else:
+                messages = [frame]
+            # Invalid command of one client must not fail merged frame of the others
+            if all(broker.valid_message(message) for message in messages):
+                voltages = broker.submit(messages)
+            else:
+                voltages = broker.reject(messages)
+            self.wfile.write(struct.pack('!%df' % len(voltages), *voltages))
+
+
+class BrokerServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Class accepting clients on Unix socket, every client is served in its own thread
+    """
+    daemon_threads = True
+
+    def __init__(self, broker: Broker, path: str = ReaderConstants.BROKER_SOCKET):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, BrokerRequestHandler)
+        self.broker = broker
+        self.path = path
+
+    def server_close(self) -> None:
+        super().server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+if __name__ == '__main__':
+    METRICS.start_from_config()
+    port = serial.Serial(port=ReaderConstants.COM_PORT,
+                         baudrate=ReaderConstants.BAUD_RATE,
+                         timeout=ReaderConstants.READ_TIMEOUT)
+    comm_handler = CommunicationHandler(port)
+    if ReaderConstants.LOG_DIRECTORY is not None:
+        comm_handler.log = MeasurementLog(ReaderConstants.LOG_DIRECTORY)
+    device_broker = Broker(comm_handler)
+    device_broker.start()
+    server = BrokerServer(device_broker)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        device_broker.stop()
+        print(f'Broker: {device_broker.stats()}')
+        comm_handler.send_message(b'q\n')
+        comm_handler.close_connection()
+    sys.exit()
@@ -3,11 +3,18 @@
 
 class BridgeConstants:
     """
-    Constant values for bridge_simulator 
+    Constant values for bridge_simulator
     """
     # Serial port settings
     COM_PORT = 'COM3'
     BAUD_RATE = 9600
+    READ_TIMEOUT = 1  # [s], simulator wakes up this often when link is idle
+
+    # Link model (simulated transmission time at BAUD_RATE, processing latency, jitter, lost frames)
+    SIMULATE_LINK = False
+    LINK_LATENCY = 2e-3  # [s]
+    LINK_JITTER = 1e-3  # [s]
+    LINK_DROP_RATE = 0
 
     # Potentiometer constants
     MIN_RESISTANCE = 100
@@ -25,8 +32,19 @@ class BridgeConstants:
     PWM_MIN = 2000
     PWM_MAX = 7000
 
-    PREV_PWM1 = 0
-    PREV_PWM2 = 0
+    # Voltage surface index - PWM step of coarse grid over whole PWM domain, then steps of local refinement
+    SURFACE_STEPS = (50, 10, 1)
+
+    # Multi-bridge simulator - every channel has its own bridge,
+    # tolerances are multipliers of nominal C, R3, R4, L
+    MULTI_BRIDGE = True
+    CHANNEL_TOLERANCES = {
+        '1': (1, 1, 1, 1),
+        '2': (1.05, 0.98, 1.01, 0.95),
+        '3': (0.95, 1.02, 0.99, 1.05),
+        '4': (1.02, 1.01, 0.97, 0.98)
+    }
+
     PREV_VOLTAGE = 10
 
 
@@ -37,14 +55,32 @@ class ReaderConstants:
     # Serial port settings
     COM_PORT = 'COM3'
     BAUD_RATE = 9600
+    READ_TIMEOUT = 0.5  # [s], added to transmission time of expected response
+    RETRIES = 3
+    BITS_PER_BYTE = 10  # start + 8 data + stop bit
 
     # Communication constants
     GET_VOLTAGE_MSG = b'v\n'
     NEWLINE_B = b'\n'
+    BATCH_PREFIX = b'*'  # *aXXXX;bXXXX;v\n - answered with one packed voltage per command
+    BATCH_SEPARATOR = b';'
+    BATCH_MODE = True  # False for firmware understanding only single commands
+    VOLTAGE_SIZE = 4
+    # Negotiate binary frames (protocol.BinaryProtocol) at connect time - only for firmware answering
+    # NEGOTIATE_MSG, firmware which does not know it may fail on it
+    BINARY_PROTOCOL = False
+    NEGOTIATE_MSG = b'x\n'
+    BINARY_ACK = b'BIN1'
+    ASCII_ACK = b'ASC1'  # answer to negotiation when binary protocol is not available (broker clients)
+    NEGOTIATE_TIMEOUT = 0.05  # [s], added to transmission time of negotiation answer
+    USE_BROKER = False  # connect to broker process instead of opening COM_PORT
+    BROKER_SOCKET = '/tmp/bridge_broker.sock'
+    BROKER_MAX_BATCH = 32  # max commands of queued requests merged into one frame
+    BROKER_REQUEST_TIMEOUT = 10  # [s] client request not answered in this time gets NaN voltages
     CHANNELS_LIST = ['1', '2', '3', '4']
     PWMS_LIST = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']
     LEFT_PWMS = ['A', 'C', 'E', 'G']
-    RIGHT_PWMS = ['B', 'D', 'F', 'G']
+    RIGHT_PWMS = ['B', 'D', 'F', 'H']
     CHANNEL_PWM_DICT = {
         '1': ['A', 'B'],
         '2': ['C', 'D'],
@@ -58,16 +94,38 @@ class ReaderConstants:
     MIN = 60 * SEC
     DIVIDER = 5
     STEP = 10  # 50
-    STEP1 = 500  # 10
-    STEP2 = 500  # 10
-    IF_START = True
-    WELCOME_MESSAGE = 'This script runs regularly every 5 minutes\n' \
-                      'You can however run it manually without resetting the timer' \
+    STEP1 = 500  # 10 - initial step when starting from middle of PWM range (or INITIAL_PWM)
+    MIN_STEP = 1
+    MAX_STEP = 1000
+    STEP_GROWTH = 2  # multiplier of step (and pattern move) while progress is steady
+    MAX_ITERATIONS = 1000  # compensation stops after this many iterations even if it still makes progress
+    VERBOSE = True  # print best voltage after every iteration of compensation
+    INITIAL_PWM = None  # (pwm1, pwm2) overriding starting point of compensation
+    WARM_START = True  # start from analytical balance point instead of middle of PWM range
+    WARM_START_STEP = 50  # only component tolerances are left to compensate
+    OPTIMIZER = None  # name from optimizers.OPTIMIZERS, None for built-in 3-point probing
+    PERIODIC = False  # re-check all channels in background thread instead of single compensation
+    RECOMPENSATION_PERIOD = 2 * MIN
+    RECOMPENSATION_THRESHOLD = 1e-3  # [V] channels below are not re-compensated
+    RECOMPENSATION_DRIFT = 1.1  # channels below this multiple of last compensated voltage are not re-compensated
+    RECOMPENSATION_STEP = 5  # initial step when restarting from last converged PWM values
+    MEASUREMENT_CACHE = True
+    CACHE_SIZE = 256
+    CACHE_MAX_AGE = 10 * SEC  # older measurements are repeated (drift of real bridge)
+    LOG_DIRECTORY = 'measurements'  # columnar measurement log, None to disable (written by broker if USE_BROKER)
+    LOG_BUFFER_SIZE = 256  # measurements written to disk at once
+    LOG_FLUSH_INTERVAL = 10 * SEC  # buffer is written at least this often (while measuring)
+    REPLAY_NEIGHBOURS = 4  # recorded points voltage is interpolated from during replay, 1 for nearest point
+    WELCOME_MESSAGE = 'This script checks all channels regularly every 2 minutes\n' \
+                      'You can however run it manually without resetting the timer\n' \
                       'Possible options:\n' \
                       'vX - get the current voltage for chosen channel and run compensation algorithm\n' \
                       '     (X stands for channel in range 1-4)\n' \
+                      's NAME - switch compensation strategy (probe, coordinate, golden, nelder_mead,\n' \
+                      '         pattern, gradient)\n' \
+                      'stats - show results and live statistics\n' \
+                      'metrics on/off - switch collecting of timers and counters\n' \
                       'q - quit the program\n'
-    VOLTAGE = 10
 
 
 class Results:
@@ -109,3 +167,80 @@ class Results:
         '3': None,
         '4': None
     }
+
+
+class InstrumentationConstants:
+    """
+    Constant values for hot-path timers and counters
+    """
+    ENABLED = False  # metrics can also be switched on at runtime with METRICS.enable()
+    DUMP_PERIOD = 30  # [s] period of printed stats, None to disable
+    SNAPSHOT_FILE = 'stats.json'  # machine-readable snapshot written at exit, None to disable
+    TIME_BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1)  # [s] upper bounds of duration histograms
+    COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)  # upper bounds of iteration histograms
+
+
+class SweepConstants:
+    """
+    Constant values for frequency sweep
+    """
+    START = 1e3  # [Hz]
+    STOP = 100e3  # [Hz]
+    POINTS = 21  # geometrically spaced frequencies
+    STEPS = (10, 1)  # neighbourhood radius around previous solution, then refinement step
+    OUTPUT_FILE = 'sweep.csv'
+
+
+class BenchmarkConstants:
+    """
+    Constant values for benchmark
+    """
+    # Multipliers of nominal C, R3, R4, L
+    COMPONENT_FACTORS = [
+        (1, 1, 1, 1),
+        (1.05, 0.95, 1.05, 0.95),
+        (0.9, 1.1, 0.95, 1.1)
+    ]
+    INITIAL_PWMS = [None, (2000, 2000), (4500, 4500), (7000, 7000)]  # None - warm start from balance point
+    STEPS = [50, 500]
+    OPTIMIZERS = [None, 'pattern', 'nelder_mead']  # None - built-in 3-point probing
+    CACHE = [False, True]
+    OUTPUT_FILE = 'benchmark.json'
+
+    # Import time benchmark
+    IMPORT_MODULES = ['config', 'serial', 'protocol', 'reader', 'repl', 'broker', 'bridge_simulator',
+                      'tolerance_analysis', 'visualization']
+    HEAVY_PACKAGES = ['numpy', 'matplotlib', 'PIL', 'fontTools']
+    IMPORT_RUNS = 5
+    COLD_START_TIMEOUT = 5  # [s]
+    COLD_START_BUDGET = 0.1  # [s] from process start to first PWM command
+    IMPORT_OUTPUT_FILE = 'import_benchmark.json'
+
+
+class ToleranceConstants:
+    """
+    Constant values for Monte Carlo tolerance analysis
+    """
+    SAMPLES = 10000
+    TOLERANCES = (0.1, 0.05, 0.05, 0.1, 0)  # relative tolerance of C, R3, R4, L, frequency (uniform distribution)
+    SEED = 0
+    WORKERS = None  # number of processes, None for all cores
+    CHUNK_SIZE = 1000  # samples simulated at once by one worker
+    INITIAL_PWMS = [None, (4500, 4500)]  # None - warm start from nominal balance point
+    STEPS = [10, 50, 500]
+    PERCENTILES = (0, 5, 50, 95, 100)
+    OUTPUT_FILE = 'tolerance.json'
+
+
+class VisualizationConstants:
+    """
+    Constant values for plots of voltage surface and compensation path
+    """
+    OUTPUT_DIRECTORY = 'plots'
+    QUEUE_SIZE = 16  # plots waiting for worker process, further plots are dropped (or waited for)
+    GRID_STEP = 10  # [PWM] resolution of rendered surface
+    VOLTAGE_FLOOR = 1e-5  # [V] lowest voltage of colour scale
+    CONTOUR_LEVELS = 12
+    FIGURE_SIZE = (13, 5.5)  # [in]
+    DPI = 100
+    INITIAL_PWMS = [None, (4500, 4500)]  # None - warm start from balance point
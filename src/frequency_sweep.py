@@ -0,0 +1,117 @@
+import sys
+
+import numpy as np
+
+from balance import BalanceSolver
+from bridge_simulator import BridgeBank, Potentiometer, PWM, VoltageSurfaceIndex
+from config import BridgeConstants, SweepConstants
+
+
+class FrequencySweep:
+    """
+    Class finding balancing PWM pair and residual voltage of one bridge over list of frequencies.
+    Frequency-dependent impedances of all frequencies are computed at once (one bridge per frequency),
+    every frequency starts its search from solution of previous one
+    """
+    COLUMNS = ('frequency', 'pwm1', 'pwm2', 'resistance1', 'resistance2', 'voltage', 'evaluations')
+
+    def __init__(self, frequencies, capacitance: float = BridgeConstants.CAPACITANCE,
+                 resistance3: float = BridgeConstants.RESISTANCE3, resistance4: float = BridgeConstants.RESISTANCE4,
+                 inductance: float = BridgeConstants.INDUCTANCE):
+        self.frequencies = np.asarray(frequencies, dtype=np.float64)
+        self.simulator = BridgeBank([(capacitance, resistance3, resistance4, inductance, frequency)
+                                               for frequency in self.frequencies])
+        self.balance = BalanceSolver(capacitance, resistance3, resistance4, inductance)
+        self.evaluations = np.zeros(len(self.frequencies), dtype=np.int64)
+        self.table = []
+
+    @classmethod
+    def from_constants(cls):
+        """
+        Create sweep of geometrically spaced frequencies from SweepConstants with nominal components
+        :return: frequency sweep
+        :rtype: FrequencySweep
+        """
+        return cls(np.geomspace(SweepConstants.START, SweepConstants.STOP, SweepConstants.POINTS))
+
+    def voltage_grid(self, index: int):
+        """
+        Get voltage function of bridge at chosen frequency, counting evaluated points
+        :param: index (int) index of frequency
+        :return: voltages for broadcast arrays of left and right PWM values
+        :rtype: callable
+        """
+        def evaluate(pwm1_array, pwm2_array) -> np.ndarray:
+            voltages = self.simulator.get_channel_voltage_grid(index, pwm1_array, pwm2_array)
+            self.evaluations[index] += voltages.size
+            return voltages
+        return evaluate
+
+    def solve(self, index: int, initial: tuple = None) -> tuple:
+        """
+        Find minimum at chosen frequency, from whole surface index or locally around initial point
+        :param: index (int) index of frequency
+        :param: initial (tuple) left and right PWM value of previous solution, None for no previous solution
+        :return: left PWM value, right PWM value and voltage
+        :rtype: tuple
+        """
+        voltage_grid = self.voltage_grid(index)
+        if initial is None:
+            return VoltageSurfaceIndex(voltage_grid).minimum()
+        pwm1, pwm2 = initial
+        voltage = float(voltage_grid(pwm1, pwm2))
+        return VoltageSurfaceIndex.descend(voltage_grid, pwm1, pwm2, voltage, SweepConstants.STEPS)
+
+    def run(self) -> list:
+        """
+        Solve all frequencies in order, previous solution is starting point of next frequency
+        :return: table row for every frequency
+        :rtype: list
+        """
+        solutions = []
+        initial = None
+        for index in range(len(self.frequencies)):
+            pwm1, pwm2, _ = self.solve(index, initial)
+            solutions.append((pwm1, pwm2))
+            initial = (pwm1, pwm2)
+        pwms = np.array(solutions, dtype=np.float64)
+        # Residual voltages of all frequencies in one call
+        voltages = self.simulator.get_voltage_grid(pwms)
+        resistances = Potentiometer.position_to_resistance(PWM.map_pwm_array(pwms))
+        self.table = [dict(zip(self.COLUMNS, (float(frequency), int(pwm1), int(pwm2), float(resistance1),
+                                              float(resistance2), float(voltage), int(evaluations))))
+                      for frequency, (pwm1, pwm2), (resistance1, resistance2), voltage, evaluations
+                      in zip(self.frequencies, solutions, resistances, voltages, self.evaluations)]
+        return self.table
+
+    def save(self, path: str) -> None:
+        """
+        Save table as CSV
+        :param: path (str) output file
+        :return: None
+        """
+        with open(path, 'w') as file:
+            file.write(','.join(self.COLUMNS) + '\n')
+            for row in self.table:
+                file.write(','.join(str(row[column]) for column in self.COLUMNS) + '\n')
+
+    def display(self) -> None:
+        """
+        Print table
+        :return: None
+        """
+        resistance1, resistance2 = self.balance.resistances()
+        print(f'Analytical balance: R1 [{resistance1:.1f}], R2 [{resistance2:.1f}], PWM {self.balance.pwms()}')
+        print(f'{"Frequency [Hz]":>15} {"PWM1":>6} {"PWM2":>6} {"R1":>8} {"R2":>8} {"Voltage [V]":>12} '
+              f'{"Evaluations":>11}')
+        for row in self.table:
+            print(f'{row["frequency"]:>15.1f} {row["pwm1"]:>6} {row["pwm2"]:>6} {row["resistance1"]:>8.1f} '
+                  f'{row["resistance2"]:>8.1f} {row["voltage"]:>12.4g} {row["evaluations"]:>11}')
+
+
+if __name__ == '__main__':
+    output_file = sys.argv[1] if len(sys.argv) > 1 else SweepConstants.OUTPUT_FILE
+    sweep = FrequencySweep.from_constants()
+    sweep.run()
+    sweep.save(output_file)
+    sweep.display()
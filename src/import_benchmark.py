@@ -0,0 +1,169 @@
+import json
+import os
+import platform
+import select
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from config import BenchmarkConstants, ReaderConstants
+
+SOURCE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# Runs reader.py as script with COM_PORT replaced by pseudo-terminal given as argument
+# and BINARY_PROTOCOL given as third argument
+READER_SCRIPT = ('import runpy, sys\n'
+                 'import config\n'
+                 'config.ReaderConstants.COM_PORT = sys.argv[1]\n'
+                 'config.ReaderConstants.BINARY_PROTOCOL = sys.argv[3] == "1"\n'
+                 'runpy.run_path(sys.argv[2], run_name="__main__")\n')
+
+# Cold start variants - (negotiate binary protocol, other module answers negotiation)
+COLD_START_CASES = {
+    'ascii': (False, False),
+    'negotiated': (True, True),
+    'probe_ignored': (True, False),
+}
+
+
+class ImportBenchmark:
+    """
+    Class measuring import time of modules and cold start of reader (from process start to first PWM command),
+    every measurement runs in fresh interpreter
+    """
+    def __init__(self, runs: int = BenchmarkConstants.IMPORT_RUNS):
+        self.runs = runs
+        self.environment = dict(os.environ, PYTHONPATH=SOURCE_DIRECTORY)
+        self.results = {}
+
+    def import_time(self, module: str) -> dict:
+        """
+        Measure import of module with -X importtime
+        :param: module (str)
+        :return: median cumulative import time [s] and modules of heavy packages loaded with it
+        :rtype: dict
+        """
+        times = []
+        loaded = set()
+        for _ in range(self.runs):
+            output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                    cwd=SOURCE_DIRECTORY, env=self.environment, capture_output=True, text=True).stderr
+            for line in output.splitlines():
+                if not line.startswith('import time:') or 'cumulative' in line:
+                    continue
+                _, cumulative, name = line[len('import time:'):].split('|')
+                name = name.strip()
+                loaded.add(name.split('.')[0])
+                if name == module:
+                    times.append(int(cumulative) / 1e6)
+        return {
+            'time': statistics.median(times),
+            'heavy_packages': sorted(loaded & set(BenchmarkConstants.HEAVY_PACKAGES))
+        }
+
+    def interpreter_start(self) -> float:
+        """
+        Measure start of empty interpreter (lower limit of cold start)
+        :return: median time [s]
+        :rtype: float
+        """
+        times = []
+        for _ in range(self.runs):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, '-c', 'pass'], env=self.environment)
+            times.append(time.perf_counter() - start)
+        return statistics.median(times)
+
+    def cold_start(self, negotiate: bool = False, answer: bool = False) -> float:
+        """
+        Start reader.py against pseudo-terminal acting as other module
+        and measure time until first PWM command arrives
+        :param: negotiate (bool) reader negotiates binary protocol
+        :param: answer (bool) other module answers negotiation, otherwise it is ignored (old firmware)
+        :return: time [s]
+        :rtype: float
+        """
+        import tty
+
+        master, slave = os.openpty()
+        tty.setraw(master)
+        tty.setraw(slave)
+        with tempfile.TemporaryDirectory() as directory:
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, '-c', READER_SCRIPT, os.ttyname(slave),
+                                        os.path.join(SOURCE_DIRECTORY, 'reader.py'), str(int(negotiate))],
+                                       cwd=directory, env=self.environment, stdout=subprocess.DEVNULL)
+            try:
+                buffer = b''
+                while True:
+                    ready, _, _ = select.select([master], [], [], BenchmarkConstants.COLD_START_TIMEOUT)
+                    if not ready:
+                        raise TimeoutError('Reader did not send any PWM command')
+                    buffer += os.read(master, 64)
+                    if buffer.startswith(ReaderConstants.NEGOTIATE_MSG):
+                        if answer:
+                            os.write(master, ReaderConstants.BINARY_ACK)
+                        buffer = buffer[len(ReaderConstants.NEGOTIATE_MSG):]
+                    if buffer:
+                        return time.perf_counter() - start
+            finally:
+                process.kill()
+                process.wait()
+                os.close(master)
+                os.close(slave)
+
+    def run(self) -> dict:
+        """
+        Measure import time of all modules from BenchmarkConstants and cold start of reader in every
+        COLD_START_CASES variant
+        :return: results
+        :rtype: dict
+        """
+        self.results['interpreter_start'] = self.interpreter_start()
+        self.results['imports'] = {module: self.import_time(module) for module in BenchmarkConstants.IMPORT_MODULES}
+        if hasattr(os, 'openpty'):
+            self.results['cold_start'] = {
+                case: statistics.median(self.cold_start(*options) for _ in range(self.runs))
+                for case, options in COLD_START_CASES.items()
+            }
+        return self.results
+
+    def save(self, path: str) -> None:
+        """
+        Save results as JSON
+        :param: path (str) output file
+        :return: None
+        """
+        report = {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'runs': self.runs,
+            'results': self.results,
+        }
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    def display(self) -> None:
+        """
+        Print results
+        :return: None
+        """
+        print(f'Interpreter start: [{self.results["interpreter_start"] * 1e3:.1f}][ms]')
+        for module, result in self.results['imports'].items():
+            heavy = f' (loads {", ".join(result["heavy_packages"])})' if result['heavy_packages'] else ''
+            print(f'import {module}: [{result["time"] * 1e3:.1f}][ms]{heavy}')
+        for case, cold_start in self.results.get('cold_start', {}).items():
+            budget = 'within' if cold_start < BenchmarkConstants.COLD_START_BUDGET else 'over'
+            print(f'Cold start to first PWM command ({case}): [{cold_start * 1e3:.1f}][ms] '
+                  f'({budget} {BenchmarkConstants.COLD_START_BUDGET * 1e3:g} ms budget)')
+
+
+if __name__ == '__main__':
+    output_file = sys.argv[1] if len(sys.argv) > 1 else BenchmarkConstants.IMPORT_OUTPUT_FILE
+    benchmark = ImportBenchmark()
+    benchmark.run()
+    benchmark.save(output_file)
+    benchmark.display()
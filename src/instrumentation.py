@@ -0,0 +1,263 @@
+import bisect
+import functools
+import sys
+import threading
+import time
+
+from config import InstrumentationConstants
+
+
+class Histogram:
+    """
+    Class counting observed values in buckets with fixed upper bounds (last bucket is unbounded)
+    """
+    def __init__(self, bounds: tuple = InstrumentationConstants.TIME_BUCKETS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float) -> None:
+        """
+        Add observed value
+        :param: value (float)
+        :return: None
+        """
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> dict:
+        """
+        Get histogram as plain dictionary
+        :return: count, total, mean, max and number of values in every bucket (keyed by upper bound)
+        :rtype: dict
+        """
+        labels = [f'<={bound:g}' for bound in self.bounds] + [f'>{self.bounds[-1]:g}']
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'buckets': dict(zip(labels, self.buckets))
+        }
+
+
+class Timer:
+    """
+    Context manager measuring duration of code block into histogram of given name
+    """
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name: str):
+        self.metrics = metrics
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+
+
+class NullTimer:
+    """
+    Context manager doing nothing, used while metrics are disabled
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Metrics:
+    """
+    Class collecting counters and histograms (durations, iterations) of hot paths.
+    Disabled metrics cost one attribute check per call, they can be enabled and disabled at runtime
+    """
+    def __init__(self, enabled: bool = InstrumentationConstants.ENABLED):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.started = time.time()
+        self.dump_thread = None
+        self.dump_stop = threading.Event()
+
+    def enable(self) -> None:
+        """
+        Start collecting metrics
+        :return: None
+        """
+        self.enabled = True
+
+    def disable(self) -> None:
+        """
+        Stop collecting metrics (collected values are kept)
+        :return: None
+        """
+        self.enabled = False
+
+    def reset(self) -> None:
+        """
+        Drop all collected values
+        :return: None
+        """
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+            self.started = time.time()
+
+    def count(self, name: str, value: int = 1) -> None:
+        """
+        Increase counter
+        :param: name (str)
+        :param: value (int)
+        :return: None
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float, bounds: tuple = InstrumentationConstants.TIME_BUCKETS) -> None:
+        """
+        Add value to histogram
+        :param: name (str)
+        :param: value (float) duration [s] or other quantity (e.g. number of iterations)
+        :param: bounds (tuple) bucket upper bounds, used when histogram is created
+        :return: None
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(bounds)
+            histogram.add(value)
+
+    def timer(self, name: str):
+        """
+        Get context manager measuring duration of code block
+        :param: name (str)
+        :return: timer
+        :rtype: Timer | NullTimer
+        """
+        return Timer(self, name) if self.enabled else NULL_TIMER
+
+    def timed(self, name: str):
+        """
+        Decorator measuring duration of every function call
+        :param: name (str)
+        :return: decorator
+        """
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with Timer(self, name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> dict:
+        """
+        Get machine-readable copy of all collected values
+        :return: counters and histograms
+        :rtype: dict
+        """
+        with self.lock:
+            return {
+                'timestamp': time.time(),
+                'uptime': time.time() - self.started,
+                'enabled': self.enabled,
+                'counters': dict(self.counters),
+                'histograms': {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+            }
+
+    def save(self, path: str) -> None:
+        """
+        Save snapshot as JSON
+        :param: path (str)
+        :return: None
+        """
+        import json
+
+        with open(path, 'w') as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+    def dump(self, file=None) -> None:
+        """
+        Print collected values in human-readable form
+        :param: file (file-like object) sys.stdout by default
+        :return: None
+        """
+        file = file if file is not None else sys.stdout
+        snapshot = self.snapshot()
+        print(f'--- stats after {snapshot["uptime"]:.1f}s ---', file=file)
+        for name, value in sorted(snapshot['counters'].items()):
+            print(f'{name}: {value}', file=file)
+        for name, histogram in sorted(snapshot['histograms'].items()):
+            buckets = ' '.join(f'{label}:{count}' for label, count in histogram['buckets'].items() if count)
+            print(f'{name}: count={histogram["count"]} mean={histogram["mean"]:.6g} max={histogram["max"]:.6g} '
+                  f'[{buckets}]', file=file)
+        file.flush()
+
+    def start_dump(self, period: float = InstrumentationConstants.DUMP_PERIOD, file=None) -> None:
+        """
+        Print collected values every period in background thread
+        :param: period (float) [s]
+        :param: file (file-like object) sys.stdout by default
+        :return: None
+        """
+        if self.dump_thread is not None:
+            return
+        self.dump_stop.clear()
+
+        def dump_periodically():
+            while not self.dump_stop.wait(period):
+                self.dump(file)
+
+        self.dump_thread = threading.Thread(target=dump_periodically, daemon=True)
+        self.dump_thread.start()
+
+    def stop_dump(self) -> None:
+        """
+        Stop periodic printing
+        :return: None
+        """
+        if self.dump_thread is None:
+            return
+        self.dump_stop.set()
+        self.dump_thread.join()
+        self.dump_thread = None
+
+    def start_from_config(self) -> None:
+        """
+        Enable metrics, periodic dump and snapshot on exit according to InstrumentationConstants
+        :return: None
+        """
+        if not InstrumentationConstants.ENABLED:
+            return
+        self.enable()
+        if InstrumentationConstants.DUMP_PERIOD is not None:
+            self.start_dump(InstrumentationConstants.DUMP_PERIOD)
+        if InstrumentationConstants.SNAPSHOT_FILE is not None:
+            import atexit
+            atexit.register(self.save, InstrumentationConstants.SNAPSHOT_FILE)
+
+
+# Shared by reader and simulator modules
+METRICS = Metrics()
@@ -0,0 +1,193 @@
+import time
+from collections import OrderedDict
+
+from config import ReaderConstants
+
+
+class MeasurementCache:
+    """
+    Class placed between compensation algorithm and CommunicationHandler (same interface),
+    answers repeated probes from bounded LRU cache keyed by (channel, pwm_left, pwm_right)
+    and does not resend PWM values the device is already set to
+    """
+    def __init__(self, communication_handler, size: int = ReaderConstants.CACHE_SIZE,
+                 max_age: float = ReaderConstants.CACHE_MAX_AGE):
+        self.comm = communication_handler
+        self.size = size
+        self.max_age = max_age
+        self.entries = OrderedDict()
+        self.device_pwms = dict.fromkeys(ReaderConstants.PWMS_LIST)
+        self.active_channel = ReaderConstants.CHOSEN_CHANNEL
+        self.pwm_channel = {pwm: channel for channel, pwms in ReaderConstants.CHANNEL_PWM_DICT.items()
+                            for pwm in pwms}
+        self.hits = 0
+        self.misses = 0
+        self.saved_messages = 0
+        self.round_trips = 0
+
+    def create_message(self, pwm: str, position: int) -> bytes:
+        """
+        Create an output message from passed arguments
+        :param: pwm (str) chosen channel from A to H
+        :param: position (int) position to be set
+        :return: merged message
+        :rtype: bytes
+        """
+        return self.comm.create_message(pwm, position)
+
+    def parse_command(self, message: bytes) -> tuple:
+        """
+        Parse PWM command
+        :param: message (bytes)
+        :return: PWM name and value, (None, None) for other messages
+        :rtype: tuple
+        """
+        return self.comm.parse_command(message)
+
+    def send_message(self, message: bytes) -> None:
+        """
+        Send raw message, device state is unknown afterwards
+        :param: message (bytes)
+        :return: None
+        """
+        self.device_pwms = dict.fromkeys(ReaderConstants.PWMS_LIST)
+        self.comm.send_message(message)
+
+    def close_connection(self) -> None:
+        """
+        Close serial port connection
+        :return: None
+        """
+        self.comm.close_connection()
+
+    def clear(self) -> None:
+        """
+        Forget all measurements and device state
+        :return: None
+        """
+        self.entries.clear()
+        self.device_pwms = dict.fromkeys(ReaderConstants.PWMS_LIST)
+
+    def key(self, channel: str, pwms: dict) -> tuple:
+        """
+        Create cache key for channel in given state
+        :param: channel (str)
+        :param: pwms (dict) PWM values
+        :return: key, None if state of channel is unknown
+        :rtype: tuple
+        """
+        pwm_left, pwm_right = ReaderConstants.CHANNEL_PWM_DICT[channel]
+        if pwms[pwm_left] is None or pwms[pwm_right] is None:
+            return None
+        return channel, pwms[pwm_left], pwms[pwm_right]
+
+    def get(self, key: tuple):
+        """
+        Get fresh measurement from cache
+        :param: key (tuple)
+        :return: voltage or None
+        """
+        if key is None or key not in self.entries:
+            return None
+        timestamp, voltage = self.entries[key]
+        if time.monotonic() - timestamp > self.max_age:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return voltage
+
+    def peek(self, key: tuple):
+        """
+        Get fresh measurement from cache without changing it (safe to call while cache is used by other thread)
+        :param: key (tuple)
+        :return: voltage or None
+        """
+        entry = self.entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.max_age:
+            return None
+        return entry[1]
+
+    def put(self, key: tuple, voltage: float) -> None:
+        """
+        Store measurement, drop least recently used one if cache is full
+        :param: key (tuple)
+        :param: voltage (float)
+        :return: None
+        """
+        if key is None:
+            return
+        self.entries[key] = (time.monotonic(), voltage)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def handle_message(self, message: bytes) -> float:
+        """
+        Handle single message
+        :param: message (bytes)
+        :return: voltage
+        :rtype: float
+        """
+        return self.handle_batch([message])[0]
+
+    def handle_batch(self, messages: list) -> list:
+        """
+        Handle messages, sending only these needed to measure uncached states
+        :param: messages (list) messages compliant to the protocol
+        :return: one voltage per message
+        :rtype: list
+        """
+        target = dict(self.device_pwms)
+        sent = dict(self.device_pwms)
+        channel = self.active_channel
+        results = [None] * len(messages)
+        outgoing = []
+        outgoing_keys = []
+        result_slots = {}
+        for i, message in enumerate(messages):
+            pwm, value = self.comm.parse_command(message)
+            if pwm is not None:
+                target[pwm] = value
+                channel = self.pwm_channel[pwm]
+            key = self.key(channel, target)
+            voltage = self.get(key)
+            if voltage is not None:
+                self.hits += 1
+                results[i] = voltage
+                continue
+            self.misses += 1
+            changed = [name for name in ReaderConstants.CHANNEL_PWM_DICT[channel] if sent[name] != target[name]]
+            for name in changed:
+                outgoing.append(self.comm.create_message(name, target[name]))
+                sent[name] = target[name]
+                outgoing_keys.append(self.key(channel, sent))
+            if not changed:
+                outgoing.append(message)
+                outgoing_keys.append(key)
+            result_slots[len(outgoing) - 1] = i
+        for name in ReaderConstants.PWMS_LIST:
+            if target[name] is not None and sent[name] != target[name]:
+                outgoing.append(self.comm.create_message(name, target[name]))
+                sent[name] = target[name]
+                outgoing_keys.append(self.key(self.pwm_channel[name], sent))
+        self.saved_messages += max(len(messages) - len(outgoing), 0)
+
+        if outgoing:
+            self.round_trips += 1
+            voltages = self.comm.handle_batch(outgoing)
+            for index, voltage in enumerate(voltages):
+                self.put(outgoing_keys[index], voltage)
+                if index in result_slots:
+                    results[result_slots[index]] = voltage
+        self.device_pwms = sent
+        self.active_channel = channel
+        return results
+
+    def stats(self) -> dict:
+        """
+        Get cache statistics
+        :return: hits, misses, messages not sent and performed round-trips
+        :rtype: dict
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'saved_messages': self.saved_messages,
+                'round_trips': self.round_trips}
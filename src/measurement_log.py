@@ -0,0 +1,108 @@
+import atexit
+import os
+import sys
+import time
+from array import array
+
+from config import ReaderConstants
+
+
+class MeasurementLog:
+    """
+    Class appending every measurement to columnar on-disk log (one binary file per column),
+    writes are buffered and done in bulk (when buffer is full or flush interval elapsed, remaining measurements
+    are written on close or at interpreter exit), log can be read back as memory-mapped NumPy arrays
+    """
+    # Column name: (array typecode used for writing, NumPy dtype used for reading)
+    COLUMNS = {
+        'timestamp': ('d', '<f8'),
+        'channel': ('B', 'u1'),
+        'pwm_left': ('H', '<u2'),
+        'pwm_right': ('H', '<u2'),
+        'voltage': ('f', '<f4')
+    }
+
+    def __init__(self, directory: str = ReaderConstants.LOG_DIRECTORY,
+                 buffer_size: int = ReaderConstants.LOG_BUFFER_SIZE,
+                 flush_interval: float = ReaderConstants.LOG_FLUSH_INTERVAL):
+        self.directory = directory
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+        os.makedirs(directory, exist_ok=True)
+        self.buffers = {name: array(typecode) for name, (typecode, _) in self.COLUMNS.items()}
+        atexit.register(self.close)
+
+    @classmethod
+    def column_path(cls, directory: str, name: str) -> str:
+        """
+        Get path of column file
+        :param: directory (str)
+        :param: name (str) column name
+        :return: path
+        :rtype: str
+        """
+        return os.path.join(directory, f'{name}.bin')
+
+    def append(self, channel: str, pwm_left: int, pwm_right: int, voltage: float) -> None:
+        """
+        Add measurement to buffer, write buffer to disk when full or when flush interval elapsed
+        :param: channel (str)
+        :param: pwm_left (int)
+        :param: pwm_right (int)
+        :param: voltage (float)
+        :return: None
+        """
+        self.buffers['timestamp'].append(time.time())
+        self.buffers['channel'].append(int(channel))
+        self.buffers['pwm_left'].append(int(pwm_left))
+        self.buffers['pwm_right'].append(int(pwm_right))
+        self.buffers['voltage'].append(voltage)
+        if len(self.buffers['timestamp']) >= self.buffer_size \
+                or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write buffered measurements to disk
+        :return: None
+        """
+        self.last_flush = time.monotonic()
+        if not self.buffers['timestamp']:
+            return
+        for name, buffer in self.buffers.items():
+            # Columns are stored little-endian
+            if sys.byteorder == 'big':
+                buffer.byteswap()
+            with open(self.column_path(self.directory, name), 'ab') as file:
+                buffer.tofile(file)
+            del buffer[:]
+
+    def close(self) -> None:
+        """
+        Write remaining measurements
+        :return: None
+        """
+        self.flush()
+        atexit.unregister(self.close)
+
+    @classmethod
+    def read(cls, directory: str = ReaderConstants.LOG_DIRECTORY) -> dict:
+        """
+        Open log as memory-mapped NumPy arrays (nothing is loaded into RAM until used)
+        :param: directory (str)
+        :return: array for every column, all of the same length
+        :rtype: dict
+        """
+        import numpy as np
+
+        dtypes = {name: np.dtype(dtype) for name, (_, dtype) in cls.COLUMNS.items()}
+        sizes = []
+        for name, dtype in dtypes.items():
+            path = cls.column_path(directory, name)
+            sizes.append(os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0)
+        length = min(sizes)
+        if length == 0:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in dtypes.items()}
+        return {name: np.memmap(cls.column_path(directory, name), dtype=dtype, mode='r', shape=(length,))
+                for name, dtype in dtypes.items()}
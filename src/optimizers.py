@@ -0,0 +1,402 @@
+import abc
+import math
+from dataclasses import dataclass
+
+from config import BridgeConstants, ReaderConstants
+
+
+@dataclass
+class OptimizationResult:
+    """
+    Result of voltage minimization
+    """
+    pwm1: int
+    pwm2: int
+    voltage: float
+    measurements: int
+
+
+class Optimizer(abc.ABC):
+    """
+    Base class for minimization engines
+    Engine gets measure(pwm1, pwm2) -> voltage function and looks for its minimum,
+    every call of measure is one voltage measurement (serial round-trip on real hardware)
+    """
+    name = 'base'
+
+    def __init__(self, step: float = ReaderConstants.STEP1, max_measurements: int = 500):
+        self.step = step
+        self.max_measurements = max_measurements
+        self.measurements = 0
+        self._measure = None
+        self._best = None
+
+    @staticmethod
+    def clamp(pwm: float) -> int:
+        """
+        Round PWM value and limit it to PWM range
+        :param: pwm (float)
+        :return: correct PWM value
+        :rtype: int
+        """
+        return int(min(max(round(pwm), BridgeConstants.PWM_MIN), BridgeConstants.PWM_MAX))
+
+    def evaluate(self, pwm1: float, pwm2: float) -> float:
+        """
+        Measure voltage in given point, count measurement and remember best point
+        :param: pwm1 (float) left PWM value
+        :param: pwm2 (float) right PWM value
+        :return: voltage
+        :rtype: float
+        """
+        pwm1, pwm2 = self.clamp(pwm1), self.clamp(pwm2)
+        voltage = self._measure(pwm1, pwm2)
+        self.measurements += 1
+        if self._best is None or voltage < self._best[2]:
+            self._best = (pwm1, pwm2, voltage)
+        return voltage
+
+    def exhausted(self) -> bool:
+        """
+        Check if measurement budget is used up
+        :return: True if no more measurements should be taken
+        :rtype: bool
+        """
+        return self.measurements >= self.max_measurements
+
+    def minimize(self, measure, pwm1: int, pwm2: int) -> OptimizationResult:
+        """
+        Find minimum of measured voltage starting from given point
+        :param: measure (callable) function (pwm1, pwm2) -> voltage
+        :param: pwm1 (int) initial left PWM value
+        :param: pwm2 (int) initial right PWM value
+        :return: best point found and number of measurements used
+        :rtype: OptimizationResult
+        """
+        self.measurements = 0
+        self._measure = measure
+        self._best = None
+        self.search(self.clamp(pwm1), self.clamp(pwm2))
+        best_pwm1, best_pwm2, voltage = self._best
+        return OptimizationResult(best_pwm1, best_pwm2, voltage, self.measurements)
+
+    @abc.abstractmethod
+    def search(self, pwm1: int, pwm2: int) -> None:
+        """
+        Search algorithm, has to use evaluate() for every measurement
+        :param: pwm1 (int) initial left PWM value
+        :param: pwm2 (int) initial right PWM value
+        :return: None
+        """
+
+
+class CoordinateOptimizer(Optimizer):
+    """
+    Low/mid/high probing on one axis and then the other, step divided by DIVIDER when mid wins
+    (algorithm used originally by reader and simulator)
+    """
+    name = 'coordinate'
+
+    def search(self, pwm1: int, pwm2: int) -> None:
+        """
+        Probe both axes in turns while voltage decreases
+        :param: pwm1 (int) initial left PWM value
+        :param: pwm2 (int) initial right PWM value
+        :return: None
+        """
+        point = [pwm1, pwm2]
+        steps = [self.step, self.step]
+        voltage = self.evaluate(*point)
+        prev_voltage = math.inf
+        while voltage < prev_voltage and not self.exhausted():
+            prev_voltage = voltage
+            for axis in (0, 1):
+                probes = {}
+                for offset in (0, -steps[axis], steps[axis]):
+                    probe = list(point)
+                    probe[axis] = self.clamp(point[axis] + offset)
+                    probes[offset] = (self.evaluate(*probe), probe)
+                best_offset = min(probes, key=lambda key: probes[key][0])
+                if best_offset == 0:
+                    steps[axis] = max(steps[axis] / ReaderConstants.DIVIDER, 1)
+                voltage, point = probes[best_offset]
+
+
+class GoldenSectionOptimizer(Optimizer):
+    """
+    Golden-section search on one axis and then the other, repeated while voltage decreases
+    """
+    name = 'golden'
+    RATIO = (math.sqrt(5) - 1) / 2
+
+    def line_search(self, point: list, axis: int) -> None:
+        """
+        Golden-section search along one axis over whole PWM range
+        :param: point (list) current point, updated in place
+        :param: axis (int) 0 for left PWM, 1 for right PWM
+        :return: None
+        """
+        def probe(value: float) -> float:
+            tmp = list(point)
+            tmp[axis] = value
+            return self.evaluate(*tmp)
+
+        low, high = BridgeConstants.PWM_MIN, BridgeConstants.PWM_MAX
+        x1 = high - self.RATIO * (high - low)
+        x2 = low + self.RATIO * (high - low)
+        f1, f2 = probe(x1), probe(x2)
+        while high - low > 1 and not self.exhausted():
+            if f1 < f2:
+                high, x2, f2 = x2, x1, f1
+                x1 = high - self.RATIO * (high - low)
+                f1 = probe(x1)
+            else:
+                low, x1, f1 = x1, x2, f2
+                x2 = low + self.RATIO * (high - low)
+                f2 = probe(x2)
+        point[axis] = self.clamp(x1 if f1 < f2 else x2)
+
+    def search(self, pwm1: int, pwm2: int) -> None:
+        """
+        Run line search on both axes in turns while voltage decreases
+        :param: pwm1 (int) initial left PWM value
+        :param: pwm2 (int) initial right PWM value
+        :return: None
+        """
+        point = [pwm1, pwm2]
+        voltage = self.evaluate(*point)
+        prev_voltage = math.inf
+        while voltage < prev_voltage and not self.exhausted():
+            prev_voltage = voltage
+            self.line_search(point, 0)
+            self.line_search(point, 1)
+            voltage = self._best[2]
+            point = list(self._best[:2])
+
+
+class NelderMeadOptimizer(Optimizer):
+    """
+    Nelder-Mead simplex search, stops when simplex shrinks below 1 PWM unit
+    or best vertex does not improve for STALL_LIMIT iterations. Simplex flattened by PWM limits
+    is rebuilt around its best vertex. Search is restarted from best point with smaller simplex
+    (initial size again after improvement) until restart with size 1 does not improve it
+    """
+    name = 'nelder_mead'
+    STALL_LIMIT = 10
+
+    @staticmethod
+    def initial_simplex(point: list, size: float) -> list:
+        """
+        Create right-angled simplex around point, vertices are placed inward where point is near PWM limit
+        :param: point (list) first vertex
+        :param: size (float) length of simplex edges
+        :return: three vertices
+        :rtype: list
+        """
+        simplex = [list(point)]
+        for axis in (0, 1):
+            vertex = list(point)
+            if point[axis] + size <= BridgeConstants.PWM_MAX:
+                vertex[axis] = point[axis] + size
+            else:
+                vertex[axis] = point[axis] - size
+            simplex.append(vertex)
+        return simplex
+
+    @staticmethod
+    def degenerate(simplex: list) -> bool:
+        """
+        Check if vertices merged or lie on one line (e.g. clamped onto PWM limit)
+        :param: simplex (list) three vertices
+        :return: True if simplex cannot span both axes any more
+        :rtype: bool
+        """
+        (x0, y0), (x1, y1), (x2, y2) = simplex
+        return abs((x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)) < 1
+
+    def simplex_search(self, point: list, voltage: float, size: float) -> None:
+        """
+        One Nelder-Mead run from point, best point found is kept by evaluate()
+        :param: point (list) first vertex
+        :param: voltage (float) voltage in first vertex
+        :param: size (float) initial length of simplex edges
+        :return: None
+        """
+        simplex = self.initial_simplex(point, size)
+        values = [voltage] + [self.evaluate(*vertex) for vertex in simplex[1:]]
+        stalled = 0
+        while not self.exhausted() and stalled < self.STALL_LIMIT:
+            best = min(values)
+            order = sorted(range(3), key=lambda i: values[i])
+            simplex = [simplex[i] for i in order]
+            values = [values[i] for i in order]
+            size = max(abs(simplex[i][axis] - simplex[0][axis]) for i in (1, 2) for axis in (0, 1))
+            if size < 1:
+                break
+            if self.degenerate(simplex):
+                simplex = self.initial_simplex(simplex[0], size)
+                values[1:] = [self.evaluate(*vertex) for vertex in simplex[1:]]
+                continue
+            centroid = [(simplex[0][axis] + simplex[1][axis]) / 2 for axis in (0, 1)]
+            worst = simplex[2]
+            reflected = [centroid[axis] + (centroid[axis] - worst[axis]) for axis in (0, 1)]
+            f_reflected = self.evaluate(*reflected)
+            if f_reflected < values[0]:
+                expanded = [centroid[axis] + 2 * (centroid[axis] - worst[axis]) for axis in (0, 1)]
+                f_expanded = self.evaluate(*expanded)
+                if f_expanded < f_reflected:
+                    simplex[2], values[2] = expanded, f_expanded
+                else:
+                    simplex[2], values[2] = reflected, f_reflected
+            elif f_reflected < values[1]:
+                simplex[2], values[2] = reflected, f_reflected
+            else:
+                contracted = [centroid[axis] + (worst[axis] - centroid[axis]) / 2 for axis in (0, 1)]
+                f_contracted = self.evaluate(*contracted)
+                if f_contracted < values[2]:
+                    simplex[2], values[2] = contracted, f_contracted
+                else:
+                    for i in (1, 2):
+                        simplex[i] = [(simplex[0][axis] + simplex[i][axis]) / 2 for axis in (0, 1)]
+                        values[i] = self.evaluate(*simplex[i])
+            simplex = [[self.clamp(value) for value in vertex] for vertex in simplex]
+            stalled = stalled + 1 if min(values) >= best else 0
+
+    def search(self, pwm1: int, pwm2: int) -> None:
+        """
+        Run simplex searches from best point with shrinking initial size until restart does not improve it
+        :param: pwm1 (int) initial left PWM value
+        :param: pwm2 (int) initial right PWM value
+        :return: None
+        """
+        voltage = self.evaluate(pwm1, pwm2)
+        size = self.step
+        while not self.exhausted():
+            self.simplex_search(list(self._best[:2]), voltage, size)
+            if self._best[2] < voltage:
+                voltage, size = self._best[2], self.step
+            elif size > 1:
+                size = max(size / ReaderConstants.DIVIDER ** 2, 1)
+            else:
+                break
+
+
+class PatternOptimizer(Optimizer):
+    """
+    Hooke-Jeeves pattern search - exploratory moves on both axes followed by pattern move
+    in the direction of last success, step halved when no move improves voltage.
+    Search is restarted with initial step from best point until restart does not improve it
+    """
+    name = 'pattern'
+
+    def explore(self, point: list, voltage: float, step: float) -> tuple:
+        """
+        Try +/- step on every axis, keep improvements
+        :param: point (list) base point
+        :param: voltage (float) voltage in base point
+        :param: step (float) current step
+        :return: best point and its voltage
+        :rtype: tuple
+        """
+        point = list(point)
+        for axis in (0, 1):
+            for direction in (1, -1):
+                candidate = list(point)
+                candidate[axis] = self.clamp(point[axis] + direction * step)
+                if candidate == point:
+                    continue
+                f_candidate = self.evaluate(*candidate)
+                if f_candidate < voltage:
+                    point, voltage = candidate, f_candidate
+                    break
+        return point, voltage
+
+    def search(self, pwm1: int, pwm2: int) -> None:
+        """
+        Exploratory and pattern moves with step halved on failure, restarted from best point
+        :param: pwm1 (int) initial left PWM value
+        :param: pwm2 (int) initial right PWM value
+        :return: None
+        """
+        base = [pwm1, pwm2]
+        voltage = self.evaluate(*base)
+        restart_voltage, size = voltage, self.step
+        step = size
+        while not self.exhausted():
+            if step < 1:
+                # Stalled in narrow valley - restart from best point with smaller initial step
+                # (initial step again after improvement) until restart with step 1 does not improve it
+                if voltage < restart_voltage:
+                    size = self.step
+                elif size > 1:
+                    size = max(size / ReaderConstants.DIVIDER ** 2, 1)
+                else:
+                    break
+                restart_voltage, step = voltage, size
+            point, f_point = self.explore(base, voltage, step)
+            if f_point >= voltage:
+                step /= 2
+                continue
+            while f_point < voltage and not self.exhausted():
+                previous, base, voltage = base, point, f_point
+                pattern = [self.clamp(2 * base[axis] - previous[axis]) for axis in (0, 1)]
+                point, f_point = self.explore(pattern, self.evaluate(*pattern), step)
+
+
+class GradientOptimizer(Optimizer):
+    """
+    Descent along gradient estimated from central finite differences (one-sided at PWM limits),
+    with backtracking line search
+    """
+    name = 'gradient'
+
+    def search(self, pwm1: int, pwm2: int) -> None:
+        """
+        Move against gradient by step, doubled after improvement and halved otherwise
+        :param: pwm1 (int) initial left PWM value
+        :param: pwm2 (int) initial right PWM value
+        :return: None
+        """
+        point = [pwm1, pwm2]
+        voltage = self.evaluate(*point)
+        step = self.step
+        while step >= 1 and not self.exhausted():
+            h = max(step / 10, 1)
+            gradient = []
+            for axis in (0, 1):
+                # Probe beyond PWM limit would be clamped onto point - difference is taken from point itself
+                positions = (self.clamp(point[axis] - h), self.clamp(point[axis] + h))
+                values = []
+                for position in positions:
+                    probe = list(point)
+                    probe[axis] = position
+                    values.append(voltage if position == point[axis] else self.evaluate(*probe))
+                gradient.append((values[1] - values[0]) / (positions[1] - positions[0]))
+            norm = math.hypot(*gradient)
+            if norm == 0:
+                break
+            candidate = [self.clamp(point[axis] - step * gradient[axis] / norm) for axis in (0, 1)]
+            f_candidate = self.evaluate(*candidate)
+            if f_candidate < voltage:
+                point, voltage = candidate, f_candidate
+                step *= 2
+            else:
+                step /= 2
+
+
+OPTIMIZERS = {
+    optimizer.name: optimizer for optimizer in (CoordinateOptimizer, GoldenSectionOptimizer, NelderMeadOptimizer,
+                                                PatternOptimizer, GradientOptimizer)
+}
+
+
+def get_optimizer(name: str, **kwargs) -> Optimizer:
+    """
+    Create optimizer by its name
+    :param: name (str) one of OPTIMIZERS keys
+    :return: optimizer
+    :rtype: Optimizer
+    """
+    if name not in OPTIMIZERS:
+        raise ValueError(f'Unknown optimizer {name}! Should be one of: {", ".join(OPTIMIZERS)}')
+    return OPTIMIZERS[name](**kwargs)
@@ -0,0 +1,90 @@
+import struct
+
+from config import ReaderConstants
+
+
+class BinaryProtocol:
+    """
+    Compact binary framing negotiated at connect time (ASCII protocol stays as fallback)
+    Frame: 1-byte opcode (PWM name, 'v', 'q' or '*' for batch), 2-byte value, 1-byte checksum.
+    Batch is a '*' frame with number of commands as value, followed by the commands
+    """
+    FRAME = struct.Struct('!BHB')
+    SIZE = FRAME.size
+    BATCH = ord('*')
+    VOLTAGE = ord('v')
+    QUIT = ord('q')
+
+    @staticmethod
+    def checksum(opcode: int, value: int) -> int:
+        """
+        Calculate checksum of frame
+        :param: opcode (int)
+        :param: value (int)
+        :return: checksum
+        :rtype: int
+        """
+        return (opcode + (value >> 8) + (value & 0xFF)) & 0xFF
+
+    @classmethod
+    def encode(cls, opcode: int, value: int = 0) -> bytes:
+        """
+        Create binary frame
+        :param: opcode (int)
+        :param: value (int)
+        :return: frame
+        :rtype: bytes
+        """
+        value = int(value)
+        return cls.FRAME.pack(opcode, value, cls.checksum(opcode, value))
+
+    @classmethod
+    def decode(cls, frame: bytes) -> tuple:
+        """
+        Read binary frame
+        :param: frame (bytes)
+        :return: opcode and value
+        :rtype: tuple
+        """
+        opcode, value, checksum = cls.FRAME.unpack(frame)
+        if checksum != cls.checksum(opcode, value):
+            raise ValueError('Wrong checksum of binary frame!')
+        return opcode, value
+
+    @classmethod
+    def from_ascii(cls, message: bytes) -> bytes:
+        """
+        Convert ASCII message (aXXXX\\n, v\\n, q\\n) into binary frame
+        :param: message (bytes)
+        :return: frame
+        :rtype: bytes
+        """
+        message = message.rstrip(ReaderConstants.NEWLINE_B)
+        if len(message) == 1:
+            return cls.encode(message[0])
+        return cls.encode(message[0], int(message[1:]))
+
+    @classmethod
+    def batch(cls, frames: list) -> bytes:
+        """
+        Create binary batch from binary frames
+        :param: frames (list)
+        :return: frames
+        :rtype: bytes
+        """
+        return cls.encode(cls.BATCH, len(frames)) + b''.join(frames)
+
+    @classmethod
+    def frame_length(cls, buffer) -> int:
+        """
+        Get length of first complete binary frame (with batch commands) in buffer
+        :param: buffer (bytes)
+        :return: length, 0 if frame is not complete yet
+        :rtype: int
+        """
+        if len(buffer) < cls.SIZE:
+            return 0
+        length = cls.SIZE
+        if buffer[0] == cls.BATCH:
+            length += cls.SIZE * cls.FRAME.unpack_from(buffer)[1]
+        return length if len(buffer) >= length else 0
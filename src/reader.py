@@ -3,50 +3,161 @@ import struct
 import sys
 import threading
 import time
+from collections import deque
 
-from config import BridgeConstants, ReaderConstants, Results
+from config import BridgeConstants, ReaderConstants, InstrumentationConstants, Results
+from instrumentation import METRICS
+from protocol import BinaryProtocol
+
+# Control path (serial link and 3-point probing) imports only modules above, modules of optional features
+# (warm start, optimizers, broker, cache, log) are imported when the feature is used - see import_benchmark.py
 
 
 class CommunicationHandler:
     """
     Class handling serial communication - reading and writing message
     """
-    def __init__(self):
-        self.serial_port = serial.Serial(port=ReaderConstants.COM_PORT,
-                                         baudrate=ReaderConstants.BAUD_RATE)
+    def __init__(self, serial_port=None):
+        if serial_port is None and ReaderConstants.USE_BROKER:
+            from transport import SocketSerial
+            serial_port = SocketSerial(ReaderConstants.BROKER_SOCKET)
+        elif serial_port is None:
+            serial_port = serial.Serial(port=ReaderConstants.COM_PORT,
+                                        baudrate=ReaderConstants.BAUD_RATE,
+                                        timeout=ReaderConstants.READ_TIMEOUT)
+        self.serial_port = serial_port
+        self.timeouts = 0
+        self.partial_frames = 0
+        self.binary = False
+        self.log = None
+        self.active_channel = ReaderConstants.CHOSEN_CHANNEL
+        self.pwm_channel = {pwm: channel for channel, pwms in ReaderConstants.CHANNEL_PWM_DICT.items()
+                            for pwm in pwms}
+        if ReaderConstants.BINARY_PROTOCOL:
+            self.negotiate()
+
+    def negotiate(self) -> bool:
+        """
+        Ask other module for binary protocol, ASCII protocol is kept if there is no (correct) answer
+        in NEGOTIATE_TIMEOUT (late or unexpected answer is dropped)
+        :return: True if binary protocol is used
+        :rtype: bool
+        """
+        self.serial_port.reset_input_buffer()
+        self.serial_port.write(ReaderConstants.NEGOTIATE_MSG)
+        response = self.wait_for_message(len(ReaderConstants.BINARY_ACK), ReaderConstants.NEGOTIATE_TIMEOUT)
+        self.binary = response == ReaderConstants.BINARY_ACK
+        if not self.binary:
+            self.serial_port.reset_input_buffer()
+        return self.binary
 
     def send_message(self, message: bytes) -> None:
         """
-        Send message compliant to the protocol
+        Send ASCII message compliant to the protocol (converted to binary frame if binary protocol is used),
+        e.g. quit message
         :param: message (bytes) message to be sent
         :return: None
         """
+        if self.binary:
+            message = BinaryProtocol.from_ascii(message)
         self.serial_port.write(message)
 
-    def wait_for_message(self) -> None:
+    def wait_for_message(self, size: int = ReaderConstants.VOLTAGE_SIZE, read_timeout: float = None) -> bytes:
         """
-        Wait for received information
-        :return: None
+        Wait for received information (blocking read, no polling)
+        Timeout covers read_timeout plus transmission time of expected bytes
+        :param: size (int) expected response size in bytes
+        :param: read_timeout (float) [s] time to wait for first byte, None for READ_TIMEOUT
+        :return: received bytes, shorter than size on timeout
+        :rtype: bytes
         """
-        while True:
+        if read_timeout is None:
+            read_timeout = ReaderConstants.READ_TIMEOUT
+        timeout = read_timeout + size * ReaderConstants.BITS_PER_BYTE / ReaderConstants.BAUD_RATE
+        if self.serial_port.timeout != timeout:
+            self.serial_port.timeout = timeout
+        with METRICS.timer('reader.wait'):
+            response = self.serial_port.read(size=size)
+        METRICS.count('reader.bytes_received', len(response))
+        if len(response) == 0:
+            self.timeouts += 1
+            METRICS.count('reader.timeouts')
+        elif len(response) < size:
+            self.partial_frames += 1
+            METRICS.count('reader.partial_frames')
+        return response
+
+    @METRICS.timed('reader.round_trip')
+    def transfer(self, message: bytes, size: int) -> bytes:
+        """
+        Send message and wait for complete response, retry on timeout or partial frame
+        :param: message (bytes) frame to be sent as is
+        :param: size (int) expected response size in bytes
+        :return: response
+        :rtype: bytes
+        """
+        METRICS.count('reader.round_trips')
+        for attempt in range(ReaderConstants.RETRIES + 1):
+            if attempt:
+                METRICS.count('reader.retries')
             self.serial_port.reset_input_buffer()
-            while self.serial_port.in_waiting == 0:
-                pass
-            else:
-                break
+            self.serial_port.reset_output_buffer()
+            with METRICS.timer('reader.write'):
+                self.serial_port.write(message)
+            METRICS.count('reader.bytes_sent', len(message))
+            response = self.wait_for_message(size)
+            if len(response) == size:
+                return response
+        raise TimeoutError(f'No complete response to {message!r} after {ReaderConstants.RETRIES + 1} attempts')
 
     def handle_message(self, message: bytes) -> float:
         """
         Handle incoming message
-        :param: message (bytes)
+        :param: message (bytes) message created by create_message (in negotiated protocol)
         :return: response from other module
         :rtype: float
         """
-        self.serial_port.reset_output_buffer()
-        self.send_message(message)
-        self.wait_for_message()
-        response = self.serial_port.read(size=4)
-        return struct.unpack('!f', response)[0]
+        response = self.transfer(message, ReaderConstants.VOLTAGE_SIZE)
+        voltage = struct.unpack('!f', response)[0]
+        if self.log is not None:
+            self.record([message], [voltage])
+        return voltage
+
+    def handle_batch(self, messages: list) -> list:
+        """
+        Handle several messages in one round-trip (falls back to single messages if batch mode is off)
+        :param: messages (list) messages created by create_message (in negotiated protocol)
+        :return: responses from other module, one voltage per message
+        :rtype: list
+        """
+        if not ReaderConstants.BATCH_MODE:
+            return [self.handle_message(message) for message in messages]
+        if self.binary:
+            frame = BinaryProtocol.batch(messages)
+        else:
+            frame = self.create_batch_message(messages)
+        response = self.transfer(frame, ReaderConstants.VOLTAGE_SIZE * len(messages))
+        voltages = list(struct.unpack('!%df' % len(messages), response))
+        if self.log is not None:
+            self.record(messages, voltages)
+        return voltages
+
+    def record(self, messages: list, voltages: list) -> None:
+        """
+        Append measurements to log together with PWM values set at the time
+        :param: messages (list) sent messages
+        :param: voltages (list) received voltages
+        :return: None
+        """
+        for message, voltage in zip(messages, voltages):
+            pwm, value = self.parse_command(message)
+            if pwm is not None:
+                self.active_channel = self.pwm_channel[pwm]
+                Results.PWM_VALUES[pwm] = value
+            pwm_left, pwm_right = ReaderConstants.CHANNEL_PWM_DICT[self.active_channel]
+            if Results.PWM_VALUES[pwm_left] is not None and Results.PWM_VALUES[pwm_right] is not None:
+                self.log.append(self.active_channel, Results.PWM_VALUES[pwm_left], Results.PWM_VALUES[pwm_right],
+                                voltage)
 
     def first_run(self, channel: str) -> str:
         """
@@ -59,18 +170,9 @@ class CommunicationHandler:
         position_low = Results.RESULTS[pwm_name] - ReaderConstants.STEP
         position_mid = Results.RESULTS[pwm_name]
         position_high = Results.RESULTS[pwm_name] + ReaderConstants.STEP
-        message = self.create_message(pwm_name, position_low)
-        self.send_message(message)
-        self.wait_for_message()
-        low = self.serial_port.read_until().decode('utf-8')
-        message = self.create_message(pwm_name, position_mid)
-        self.send_message(message)
-        self.wait_for_message()
-        mid = self.serial_port.read_until().decode('utf-8')
-        message = self.create_message(pwm_name, position_high)
-        self.send_message(message)
-        self.wait_for_message()
-        high = self.serial_port.read_until().decode('utf-8')
+        low = self.handle_message(self.create_message(pwm_name, position_low))
+        mid = self.handle_message(self.create_message(pwm_name, position_mid))
+        high = self.handle_message(self.create_message(pwm_name, position_high))
         if low < mid < high:
             operation = 'subtract'
         else:
@@ -78,7 +180,7 @@ class CommunicationHandler:
         return operation
 
     @staticmethod
-    def create_message(pwm: str, position: int) -> bytes:
+    def create_ascii_message(pwm: str, position: int) -> bytes:
         """
         Create an output message from passed arguments
         :param: pwm (str) chosen channel from A to H (corresponding to 1-8 values)
@@ -89,149 +191,429 @@ class CommunicationHandler:
         message = b'%s%d%s' % (pwm.encode('utf-8'), position, ReaderConstants.NEWLINE_B)
         return message
 
+    def create_message(self, pwm: str, position: int) -> bytes:
+        """
+        Create an output message in negotiated protocol - binary frame is encoded directly, without ASCII form
+        :param: pwm (str) chosen channel from A to H (corresponding to 1-8 values)
+        :param: position (int) position to be set
+        :return: message
+        :rtype: bytes
+        """
+        if self.binary:
+            return BinaryProtocol.encode(ord(pwm), position)
+        return self.create_ascii_message(pwm, position)
+
     @staticmethod
-    def parse_message(message: bytes) -> int:
+    def parse_ascii_command(message: bytes) -> tuple:
         """
-        Read message and save PWM value to variable in dict
+        Parse ASCII PWM command
         :param: message (bytes)
-        :return: parsed pwm value
-        :rtype: int
+        :return: PWM name and value, (None, None) for other messages
+        :rtype: tuple
         """
-        tmp_msg = [*message]
-        channel = tmp_msg[0]
-        pwm_value = int(''.join(tmp_msg[1:5]))
-        Results.PWM_VALUES[channel] = pwm_value
-        return pwm_value
+        pwm = chr(message[0])
+        if pwm in ReaderConstants.PWMS_LIST:
+            return pwm, int(message[1:].rstrip(ReaderConstants.NEWLINE_B))
+        return None, None
+
+    def parse_command(self, message: bytes) -> tuple:
+        """
+        Parse PWM command created by create_message (in negotiated protocol)
+        :param: message (bytes)
+        :return: PWM name and value, (None, None) for other messages
+        :rtype: tuple
+        """
+        if not self.binary:
+            return self.parse_ascii_command(message)
+        opcode, value = BinaryProtocol.decode(message)
+        pwm = chr(opcode)
+        return (pwm, value) if pwm in ReaderConstants.PWMS_LIST else (None, None)
+
+    @staticmethod
+    def create_batch_message(messages: list) -> bytes:
+        """
+        Merge several messages into one batch frame, e.g. *A4500;B4500;v\n
+        :param: messages (list) messages compliant to the protocol
+        :return: merged frame
+        :rtype: bytes
+        """
+        commands = [message.rstrip(ReaderConstants.NEWLINE_B) for message in messages]
+        return ReaderConstants.BATCH_PREFIX + ReaderConstants.BATCH_SEPARATOR.join(commands) \
+            + ReaderConstants.NEWLINE_B
 
     def close_connection(self) -> None:
         """
-        Close serial port connection
+        Close serial port connection (and write remaining measurements to log)
         :return: None
         """
+        if self.log is not None:
+            self.log.close()
         self.serial_port.close()
 
 
 class ThreadHandler:
     """
-    Class handling threads - creating and running them
+    Class handling threads - periodic re-compensation of all channels running in background thread.
+    First pass compensates every channel, next passes only check voltage at last converged PWM values
+    and search again (from that point with small step) only on channels which drifted above threshold.
+    Channels can also be checked on request between periodic passes (without resetting the timer)
     """
-    def __init__(self):
-        self.thread_comm = CommunicationHandler()
-        t = threading.Thread(target=self.thread_function())
-        t.start()
+    def __init__(self, communication_handler=None, period: float = ReaderConstants.RECOMPENSATION_PERIOD,
+                 verbose: bool = ReaderConstants.VERBOSE):
+        self.thread_comm = communication_handler if communication_handler is not None else CommunicationHandler()
+        self.period = period
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        self.requests = deque()
+        self.wake_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.failed_checks = 0
+        self.thread = threading.Thread(target=self.thread_function, daemon=True)
+        self.thread.start()
 
     def thread_function(self) -> None:
         """
-        Compensate voltage on all channels every 2 minutes, run as a thread
+        Check (and compensate if needed) voltage on all channels every period and on requested channels
+        in between, run as a thread
+        :return: None
+        """
+        next_pass = time.monotonic()
+        while not self.stop_event.is_set():
+            periodic = time.monotonic() >= next_pass
+            channels = ReaderConstants.CHANNELS_LIST if periodic else self.take_requests()
+            for channel in channels:
+                if self.stop_event.is_set():
+                    break
+                with self.lock:
+                    try:
+                        self.check_channel(channel)
+                    except Exception as error:
+                        # Failed channel (e.g. TimeoutError after RETRIES) is checked again in next pass
+                        self.failed_checks += 1
+                        METRICS.count('reader.failed_checks')
+                        print(f'Channel {channel}: check failed: {error!r}', file=sys.stderr)
+            if periodic:
+                next_pass = time.monotonic() + self.period
+            self.wake_event.wait(max(next_pass - time.monotonic(), 0))
+            self.wake_event.clear()
+
+    def request_check(self, channel: str) -> None:
+        """
+        Check chosen channel as soon as possible
+        :param: channel (str)
         :return: None
         """
-        for channel in ReaderConstants.CHANNELS_LIST:
-            message = b'%s%s' % (ReaderConstants.GET_VOLTAGE_MSG, channel.encode('utf-8'))
-            self.thread_comm.send_message(message)
-            self.thread_comm.handle_message(channel)
-        ReaderConstants.IF_START = False
-        time.sleep(2 * ReaderConstants.MIN)
+        self.requests.append(channel)
+        self.wake_event.set()
+
+    def take_requests(self) -> list:
+        """
+        Take requested channels, every channel once
+        :return: channels
+        :rtype: list
+        """
+        channels = []
+        while self.requests:
+            channel = self.requests.popleft()
+            if channel not in channels:
+                channels.append(channel)
+        return channels
+
+    def check_channel(self, channel: str) -> float:
+        """
+        Measure voltage at last converged PWM values and re-compensate channel if it exceeds threshold
+        :param: channel (str)
+        :return: voltage
+        :rtype: float
+        """
+        pwm_left, pwm_right = ReaderConstants.CHANNEL_PWM_DICT[channel]
+        pwm1, pwm2 = Results.RESULTS[pwm_left], Results.RESULTS[pwm_right]
+        compensation = CompensationHandler(self.thread_comm, channel, self.verbose, self.stop_event)
+        if pwm1 is None or pwm2 is None:
+            voltage = compensation.find_minimum()
+        else:
+            voltage = compensation.measure(pwm1, pwm2)
+            # Channel is skipped if voltage is low or has not risen noticeably since last compensation
+            threshold = max(ReaderConstants.RECOMPENSATION_THRESHOLD,
+                            Results.RESULT_VOLTAGE[channel] * ReaderConstants.RECOMPENSATION_DRIFT)
+            if voltage < threshold:
+                return voltage
+            voltage = compensation.find_minimum((pwm1, pwm2, ReaderConstants.RECOMPENSATION_STEP))
+        Results.RESULTS[pwm_left] = compensation.pwm1
+        Results.RESULTS[pwm_right] = compensation.pwm2
+        Results.RESULT_VOLTAGE[channel] = voltage
+        return voltage
+
+    def stop(self) -> None:
+        """
+        Stop thread, compensation in progress is interrupted before its next batch
+        :return: None
+        """
+        self.stop_event.set()
+        self.wake_event.set()
+        self.thread.join()
+
+
+class StepController:
+    """
+    Class controlling step of one potentiometer of one channel. Local curvature is estimated from three probes
+    (low, middle, high) and potentiometer jumps to minimum of parabola fitted through them. Step is divided
+    when minimum lies between probes and enlarged while it keeps lying beyond them in the same direction
+    """
+    def __init__(self, step: float):
+        self.step = step
+        self.direction = 0
+
+    def probe_positions(self, pwm: int) -> tuple:
+        """
+        Get low and high probe around current position, limited to PWM range
+        :param: pwm (int) current position
+        :return: low and high position
+        :rtype: tuple
+        """
+        step = round(self.step)
+        return max(pwm - step, BridgeConstants.PWM_MIN), min(pwm + step, BridgeConstants.PWM_MAX)
+
+    @staticmethod
+    def parabola_minimum(positions: tuple, voltages: tuple):
+        """
+        Fit parabola through three probes and find its minimum
+        :param: positions (tuple) low, middle and high position
+        :param: voltages (tuple) voltages measured at these positions
+        :return: position of minimum, None if probes do not lie on convex parabola
+        :rtype: float | None
+        """
+        (low_pwm, pwm, high_pwm), (low, mid, high) = positions, voltages
+        if low_pwm == pwm or pwm == high_pwm:
+            return None
+        slope_low = (mid - low) / (pwm - low_pwm)
+        slope_high = (high - mid) / (high_pwm - pwm)
+        curvature = (slope_high - slope_low) / (high_pwm - low_pwm)
+        if curvature <= 0:
+            return None
+        return (low_pwm + pwm) / 2 - slope_low / (2 * curvature)
+
+    def shrink(self) -> None:
+        """
+        Divide step (down to minimal step)
+        :return: None
+        """
+        self.step = max(self.step / ReaderConstants.DIVIDER, ReaderConstants.MIN_STEP)
+        self.direction = 0
+
+    def converged(self) -> bool:
+        """
+        Check if step cannot be divided any more
+        :return: True if step is minimal
+        :rtype: bool
+        """
+        return self.step <= ReaderConstants.MIN_STEP
+
+    def update(self, pwm: int, low_pwm: int, high_pwm: int, voltages: tuple) -> int:
+        """
+        Choose next position from three probes and adapt step
+        :param: pwm (int) middle position
+        :param: low_pwm (int) low position
+        :param: high_pwm (int) high position
+        :param: voltages (tuple) voltages measured at low, middle and high position
+        :return: next position
+        :rtype: int
+        """
+        low, mid, high = voltages
+        vertex = self.parabola_minimum((low_pwm, pwm, high_pwm), voltages)
+        if mid <= low and mid <= high:
+            target = pwm if vertex is None else vertex
+            # Next probes are not closer than the jump, so the minimum stays bracketed while the valley moves
+            self.step = max(self.step / ReaderConstants.DIVIDER, abs(target - pwm), ReaderConstants.MIN_STEP)
+            self.direction = 0
+        else:
+            direction = -1 if low < high else 1
+            edge = low_pwm if direction < 0 else high_pwm
+            beyond = vertex is None or (vertex - edge) * direction > 0
+            if beyond and direction == self.direction:
+                self.step = min(self.step * ReaderConstants.STEP_GROWTH, ReaderConstants.MAX_STEP)
+            self.direction = direction if beyond else 0
+            # Jump goes towards the best probe and at most one (new) step beyond it
+            reach = edge + direction * self.step
+            target = edge if vertex is None else vertex
+            target = min(max(target, min(pwm, reach)), max(pwm, reach))
+        return self.limit(target)
+
+    @staticmethod
+    def limit(pwm: float) -> int:
+        """
+        Round position and limit it to PWM range
+        :param: pwm (float) position
+        :return: valid PWM value
+        :rtype: int
+        """
+        return round(min(max(pwm, BridgeConstants.PWM_MIN), BridgeConstants.PWM_MAX))
 
 
 class CompensationHandler:
     """
     Class handling compensation of received voltage
     """
-    def __init__(self, communication_handler: CommunicationHandler):
+    def __init__(self, communication_handler: CommunicationHandler, channel: str = None,
+                 verbose: bool = ReaderConstants.VERBOSE, stop_event: threading.Event = None):
         self.comm = communication_handler
-        self.pwm_left = ReaderConstants.CHANNEL_PWM_DICT[ReaderConstants.CHOSEN_CHANNEL][0]
-        self.pwm_right = ReaderConstants.CHANNEL_PWM_DICT[ReaderConstants.CHOSEN_CHANNEL][1]
+        self.channel = channel if channel is not None else ReaderConstants.CHOSEN_CHANNEL
+        self.verbose = verbose
+        self.stop_event = stop_event
+        self.pwm_left = ReaderConstants.CHANNEL_PWM_DICT[self.channel][0]
+        self.pwm_right = ReaderConstants.CHANNEL_PWM_DICT[self.channel][1]
+        self.pwm1 = None
+        self.pwm2 = None
 
-    def setup(self) -> float:
+    @staticmethod
+    def initial_position() -> tuple:
+        """
+        Get starting point of compensation - analytical balance point (warm start) or middle of PWM range
+        :return: left PWM value, right PWM value and initial step
+        :rtype: tuple
         """
-        Set potentiometers in initial position and read voltage
+        if ReaderConstants.INITIAL_PWM is not None:
+            pwm1, pwm2 = ReaderConstants.INITIAL_PWM
+            return pwm1, pwm2, ReaderConstants.STEP1
+        if ReaderConstants.WARM_START:
+            from balance import BalanceSolver
+            pwm1, pwm2 = BalanceSolver().pwms()
+            return pwm1, pwm2, ReaderConstants.WARM_START_STEP
+        initial_pwm = int((BridgeConstants.PWM_MIN + BridgeConstants.PWM_MAX) / 2)
+        return initial_pwm, initial_pwm, ReaderConstants.STEP1
+
+    def measure(self, pwm1: int, pwm2: int) -> float:
+        """
+        Set both potentiometers and read voltage (one round-trip)
+        :param: pwm1 (int) left PWM value
+        :param: pwm2 (int) right PWM value
         :return: voltage
         :rtype: float
         """
-        initial_pwm = int((BridgeConstants.PWM_MIN + BridgeConstants.PWM_MAX) / 2)
-        BridgeConstants.PREV_PWM1 = initial_pwm
-        BridgeConstants.PREV_PWM2 = initial_pwm
-        msg = self.comm.create_message(self.pwm_left, initial_pwm)
-        self.comm.send_message(msg)
-        self.comm.wait_for_message()
-        msg = self.comm.create_message(self.pwm_right, initial_pwm)
-        self.comm.send_message(msg)
-        self.comm.wait_for_message()
-        response = self.comm.serial_port.read(size=4)
-        return struct.unpack('!f', response)[0]
+        return self.comm.handle_batch([self.comm.create_message(self.pwm_left, pwm1),
+                                       self.comm.create_message(self.pwm_right, pwm2)])[-1]
 
-    def compensate(self) -> None:
+    def optimize(self, optimizer: 'Optimizer', initial: tuple = None) -> 'OptimizationResult':
         """
-        Compensate (find minimum) algorithm
-        :return: None
+        Find minimum with chosen optimizer engine and leave potentiometers in found position
+        :param: optimizer (Optimizer)
+        :param: initial (tuple) left PWM value, right PWM value and step, None for initial_position()
+        :return: result of minimization
+        :rtype: OptimizationResult
         """
-        voltage = self.setup()
-        while True:
-            while voltage < ReaderConstants.VOLTAGE:
-                ReaderConstants.VOLTAGE = self.comm.handle_message(b'v\n')
-
-                prev_pwm1 = BridgeConstants.PREV_PWM1
-                msg = self.comm.create_message(self.pwm_left, prev_pwm1)
-                mid1 = self.comm.handle_message(msg)
-
-                low_pwm1 = prev_pwm1 - ReaderConstants.STEP1
-                if low_pwm1 < BridgeConstants.PWM_MIN:
-                    low_pwm1 = BridgeConstants.PWM_MIN
-                msg = self.comm.create_message(self.pwm_left, low_pwm1)
-                low1 = self.comm.handle_message(msg)
-
-                high_pwm1 = prev_pwm1 + ReaderConstants.STEP1
-                if high_pwm1 > BridgeConstants.PWM_MAX:
-                    high_pwm1 = BridgeConstants.PWM_MAX
-                msg = self.comm.create_message(self.pwm_left, high_pwm1)
-                high1 = self.comm.handle_message(msg)
-
-                tmp1 = (low1, mid1, high1)
-                if min(tmp1) == low1:
-                    BridgeConstants.PREV_PWM1 = low_pwm1
-                elif min(tmp1) == mid1:
-                    ReaderConstants.STEP1 = ReaderConstants.STEP1 / ReaderConstants.DIVIDER
-                    if ReaderConstants.STEP1 < 1:
-                        ReaderConstants.STEP1 = 1
-                    BridgeConstants.PREV_PWM1 = prev_pwm1
-                else:
-                    BridgeConstants.PREV_PWM1 = high_pwm1
-                msg = self.comm.create_message(self.pwm_left, BridgeConstants.PREV_PWM1)
-                dummy = self.comm.handle_message(msg)
-
-                prev_pwm2 = BridgeConstants.PREV_PWM2
-                msg = self.comm.create_message(self.pwm_right, prev_pwm2)
-                mid2 = self.comm.handle_message(msg)
-
-                low_pwm2 = prev_pwm1 - ReaderConstants.STEP1
-                if low_pwm2 < BridgeConstants.PWM_MIN:
-                    low_pwm2 = BridgeConstants.PWM_MIN
-                msg = self.comm.create_message(self.pwm_right, low_pwm2)
-                low2 = self.comm.handle_message(msg)
-
-                high_pwm2 = prev_pwm1 + ReaderConstants.STEP1
-                if high_pwm2 > BridgeConstants.PWM_MAX:
-                    high_pwm2 = BridgeConstants.PWM_MAX
-                msg = self.comm.create_message(self.pwm_right, high_pwm2)
-                high2 = self.comm.handle_message(msg)
-
-                tmp2 = (low2, mid2, high2)
-                if min(tmp2) == low2:
-                    BridgeConstants.PREV_PWM2 = low_pwm2
-                elif min(tmp2) == mid2:
-                    ReaderConstants.STEP2 = ReaderConstants.STEP2 / ReaderConstants.DIVIDER
-                    if ReaderConstants.STEP2 < 1:
-                        ReaderConstants.STEP2 = 1
-                    BridgeConstants.PREV_PWM2 = prev_pwm2
+        initial_pwm1, initial_pwm2, step = initial if initial is not None else self.initial_position()
+        result = optimizer.minimize(self.measure, initial_pwm1, initial_pwm2)
+        self.measure(result.pwm1, result.pwm2)
+        METRICS.observe('reader.measurements', result.measurements, InstrumentationConstants.COUNT_BUCKETS)
+        self.pwm1 = result.pwm1
+        self.pwm2 = result.pwm2
+        if self.verbose:
+            print(f'Optimizer {optimizer.name}: [{result.measurements}] measurements')
+        return result
+
+    def search(self, initial: tuple):
+        """
+        Compensation algorithm as generator - yields batches of messages and receives their voltages, so the same
+        algorithm runs on blocking link (find_minimum) and on asyncio link (async_reader).
+        Potentiometers are probed in turns, each with its own step controller. Every batch moves the other
+        potentiometer to its new position, probes the chosen one on both sides and measures pattern point,
+        so an iteration takes two round-trips. Runs until an iteration with minimal steps does not find lower
+        voltage, MAX_ITERATIONS is reached or stop_event is set
+        :param: initial (tuple) left PWM value, right PWM value and step
+        :return: best measured voltage, left PWM value and right PWM value (value of StopIteration)
+        :rtype: generator
+        """
+        create = self.comm.create_message
+        pwms = list(initial[:2])
+        names = (self.pwm_left, self.pwm_right)
+        best = ((yield [create(names[0], pwms[0]), create(names[1], pwms[1])])[-1], *pwms)
+        controllers = (StepController(initial[2]), StepController(initial[2]))
+        pattern = None
+        growth = 1
+        iterations = 0
+        while iterations < ReaderConstants.MAX_ITERATIONS:
+            iteration_start = time.perf_counter()
+            iterations += 1
+            base = best
+            for axis, other in ((0, 1), (1, 0)):
+                if self.stop_event is not None and self.stop_event.is_set():
+                    # Interrupted search ends at best point measured so far
+                    return best
+                low_pwm, high_pwm = controllers[axis].probe_positions(pwms[axis])
+                messages = [create(names[other], pwms[other]),
+                            create(names[axis], pwms[axis]),
+                            create(names[axis], low_pwm),
+                            create(names[axis], high_pwm)]
+                if pattern is not None:
+                    messages += [create(names[0], pattern[0]), create(names[1], pattern[1])]
+                voltages = yield messages
+                dummy, mid, low, high = voltages[:4]
+                for position, voltage in ((pwms[axis], mid), (low_pwm, low), (high_pwm, high)):
+                    if voltage < best[0]:
+                        point = list(pwms)
+                        point[axis] = position
+                        best = (voltage, *point)
+                accepted = pattern is not None and voltages[-1] < best[0]
+                if accepted:
+                    # Probes of this potentiometer were taken around old point, continue from pattern point
+                    best = (voltages[-1], *pattern)
+                    pwms = list(pattern)
                 else:
-                    BridgeConstants.PREV_PWM2 = high_pwm2
-                msg = self.comm.create_message(self.pwm_right, BridgeConstants.PREV_PWM2)
-                dummy = self.comm.handle_message(msg)
+                    pwms[axis] = controllers[axis].update(pwms[axis], low_pwm, high_pwm, (low, mid, high))
+                if pattern is not None:
+                    growth = growth * ReaderConstants.STEP_GROWTH if accepted else 1
+                pattern = None
+            if self.verbose:
+                print(f'{best[0]}')
+            METRICS.observe('reader.iteration', time.perf_counter() - iteration_start)
+            if best[0] < base[0]:
+                # Pattern point continues progress of this iteration (along the valley), it is measured in the same
+                # round-trip as next probes and its move is enlarged while it keeps being accepted
+                pattern = [StepController.limit(best[1] + growth * (best[1] - base[1])),
+                           StepController.limit(best[2] + growth * (best[2] - base[2]))]
+                continue
+            if all(controller.converged() for controller in controllers):
+                break
+            # No progress with large steps - continue from best point with smaller steps
+            pwms = list(best[1:])
+            for controller in controllers:
+                controller.shrink()
+        else:
+            if self.verbose:
+                print(f'Channel {self.channel}: stopped after [{iterations}] iterations')
+        METRICS.observe('reader.iterations', iterations, InstrumentationConstants.COUNT_BUCKETS)
+        return best
 
-                voltage = self.comm.handle_message(b'v\n')
-                print(f'{voltage}')
+    @METRICS.timed('reader.find_minimum')
+    def find_minimum(self, initial: tuple = None) -> float:
+        """
+        Compensate (find minimum) algorithm (see search), potentiometers are left at the best measured point
+        (pwm1 and pwm2)
+        :param: initial (tuple) left PWM value, right PWM value and step, None for initial_position()
+        :return: final voltage
+        :rtype: float
+        """
+        if initial is None:
+            initial = self.initial_position()
+        if ReaderConstants.OPTIMIZER is not None:
+            from optimizers import get_optimizer
+            return self.optimize(get_optimizer(ReaderConstants.OPTIMIZER, step=initial[2]), initial).voltage
+        search = self.search(initial)
+        voltages = None
+        try:
+            while True:
+                voltages = self.comm.handle_batch(search.send(voltages))
+        except StopIteration as stop:
+            _, self.pwm1, self.pwm2 = stop.value
+        return self.measure(self.pwm1, self.pwm2)
 
-            self.teardown(voltage, BridgeConstants.PREV_PWM1, BridgeConstants.PREV_PWM2)
+    def compensate(self) -> None:
+        """
+        Compensate (find minimum) algorithm, print results and exit
+        :return: None
+        """
+        voltage = self.find_minimum()
+        self.teardown(voltage, self.pwm1, self.pwm2)
 
     def teardown(self, voltage: float, pwm1: int, pwm2: int) -> None:
         """
@@ -240,12 +622,32 @@ class CompensationHandler:
         print(f'Final voltage: [{voltage}][V]')
         print(f'PWM channel {self.pwm_left}: [{pwm1}]')
         print(f'PWM channel {self.pwm_right}: [{pwm2}]')
+        if hasattr(self.comm, 'stats'):
+            print(f'Measurement cache: {self.comm.stats()}')
         self.comm.send_message(b'q\n')
         self.comm.close_connection()
         sys.exit()
 
 
 if __name__ == '__main__':
+    METRICS.start_from_config()
     comm_handler = CommunicationHandler()
-    comp_handler = CompensationHandler(comm_handler)
-    comp_handler.compensate()
+    # Broker logs measurements of all its clients
+    if ReaderConstants.LOG_DIRECTORY is not None and not ReaderConstants.USE_BROKER:
+        from measurement_log import MeasurementLog
+        comm_handler.log = MeasurementLog(ReaderConstants.LOG_DIRECTORY)
+    if ReaderConstants.MEASUREMENT_CACHE:
+        from measurement_cache import MeasurementCache
+        comm_handler = MeasurementCache(comm_handler)
+    if ReaderConstants.PERIODIC:
+        thread_handler = ThreadHandler(comm_handler)
+        try:
+            thread_handler.thread.join()
+        except KeyboardInterrupt:
+            thread_handler.stop()
+        finally:
+            comm_handler.send_message(b'q\n')
+            comm_handler.close_connection()
+    else:
+        comp_handler = CompensationHandler(comm_handler)
+        comp_handler.compensate()
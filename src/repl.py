@@ -0,0 +1,158 @@
+import sys
+
+from config import ReaderConstants, Results
+from instrumentation import METRICS
+from measurement_cache import MeasurementCache
+from measurement_log import MeasurementLog
+from optimizers import OPTIMIZERS
+from reader import CommunicationHandler, CompensationHandler, ThreadHandler
+
+
+class ReplHandler:
+    """
+    Class reading user commands while all channels are compensated periodically in background thread.
+    Voltages are answered from cache (or last compensation) whenever possible, link is used only if it is free
+    """
+    BUILT_IN_STRATEGY = 'probe'
+
+    def __init__(self, communication_handler, period: float = ReaderConstants.RECOMPENSATION_PERIOD):
+        self.comm = communication_handler
+        # Iterations of background compensation are not printed over the prompt
+        self.thread_handler = ThreadHandler(communication_handler, period, verbose=False)
+
+    def cached_voltage(self, channel: str) -> tuple:
+        """
+        Get voltage of channel at last compensated PWM values without waiting for background compensation
+        :param: channel (str)
+        :return: voltage (None if channel was not compensated yet) and its source
+        :rtype: tuple
+        """
+        pwm_left, pwm_right = ReaderConstants.CHANNEL_PWM_DICT[channel]
+        pwm1, pwm2 = Results.RESULTS[pwm_left], Results.RESULTS[pwm_right]
+        if pwm1 is None or pwm2 is None:
+            return None, 'not compensated yet'
+        if isinstance(self.comm, MeasurementCache):
+            voltage = self.comm.peek((channel, pwm1, pwm2))
+            if voltage is not None:
+                return voltage, 'cache'
+        if self.thread_handler.lock.acquire(blocking=False):
+            try:
+                return CompensationHandler(self.comm, channel).measure(pwm1, pwm2), 'measured'
+            finally:
+                self.thread_handler.lock.release()
+        return Results.RESULT_VOLTAGE[channel], 'last compensation'
+
+    def read_channel(self, channel: str) -> None:
+        """
+        Print voltage of chosen channel and request its compensation in background
+        :param: channel (str)
+        :return: None
+        """
+        if channel not in ReaderConstants.CHANNELS_LIST:
+            print(f'Wrong channel [{channel}], choose one of {ReaderConstants.CHANNELS_LIST}')
+            return
+        voltage, source = self.cached_voltage(channel)
+        pwm_left, pwm_right = ReaderConstants.CHANNEL_PWM_DICT[channel]
+        print(f'Channel number: [{channel}]')
+        print(f'Voltage: [{voltage}][V] ({source})')
+        print(f'PWM channel {pwm_left}: [{Results.RESULTS[pwm_left]}]')
+        print(f'PWM channel {pwm_right}: [{Results.RESULTS[pwm_right]}]')
+        self.thread_handler.request_check(channel)
+
+    def set_strategy(self, name: str) -> None:
+        """
+        Choose compensation algorithm used from next compensation on
+        :param: name (str) optimizer name or 'probe' for built-in 3-point probing
+        :return: None
+        """
+        if name == self.BUILT_IN_STRATEGY:
+            ReaderConstants.OPTIMIZER = None
+        elif name in OPTIMIZERS:
+            ReaderConstants.OPTIMIZER = name
+        else:
+            print(f'Unknown strategy [{name}], choose one of {[self.BUILT_IN_STRATEGY, *OPTIMIZERS]}')
+            return
+        print(f'Strategy: [{name}]')
+
+    def switch_metrics(self, state: str) -> None:
+        """
+        Switch collecting of hot-path metrics
+        :param: state (str) 'on' or 'off'
+        :return: None
+        """
+        if state == 'on':
+            METRICS.enable()
+        elif state == 'off':
+            METRICS.disable()
+        print(f'Metrics: [{"on" if METRICS.enabled else "off"}]')
+
+    def print_stats(self) -> None:
+        """
+        Print results of all channels and live statistics
+        :return: None
+        """
+        for channel in ReaderConstants.CHANNELS_LIST:
+            pwm_left, pwm_right = ReaderConstants.CHANNEL_PWM_DICT[channel]
+            print(f'Channel [{channel}]: voltage [{Results.RESULT_VOLTAGE[channel]}][V], '
+                  f'PWM {pwm_left} [{Results.RESULTS[pwm_left]}], PWM {pwm_right} [{Results.RESULTS[pwm_right]}]')
+        print(f'Strategy: [{ReaderConstants.OPTIMIZER or self.BUILT_IN_STRATEGY}]')
+        print(f'Compensation running: [{self.thread_handler.lock.locked()}]')
+        print(f'Failed channel checks: [{self.thread_handler.failed_checks}]')
+        if isinstance(self.comm, MeasurementCache):
+            print(f'Measurement cache: {self.comm.stats()}')
+        if METRICS.enabled:
+            METRICS.dump()
+
+    def handle_command(self, line: str) -> bool:
+        """
+        Execute one user command
+        :param: line (str) command read from user
+        :return: False if user wants to quit
+        :rtype: bool
+        """
+        words = line.split()
+        if not words:
+            return True
+        command, arguments = words[0], words[1:]
+        if command == 'q':
+            return False
+        if command.startswith('v') and (len(command) == 2 or arguments):
+            self.read_channel(command[1:] or arguments[0])
+        elif command == 's' and arguments:
+            self.set_strategy(arguments[0])
+        elif command == 'stats':
+            self.print_stats()
+        elif command == 'metrics':
+            self.switch_metrics(arguments[0] if arguments else '')
+        else:
+            print(ReaderConstants.WELCOME_MESSAGE)
+        return True
+
+    def run(self) -> None:
+        """
+        Read commands until user quits, then stop compensation and close communication
+        :return: None
+        """
+        print(ReaderConstants.WELCOME_MESSAGE)
+        try:
+            for line in sys.stdin:
+                if not self.handle_command(line):
+                    break
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.thread_handler.stop()
+            self.comm.send_message(b'q\n')
+            self.comm.close_connection()
+
+
+if __name__ == '__main__':
+    METRICS.start_from_config()
+    comm_handler = CommunicationHandler()
+    # Broker logs measurements of all its clients
+    if ReaderConstants.LOG_DIRECTORY is not None and not ReaderConstants.USE_BROKER:
+        comm_handler.log = MeasurementLog(ReaderConstants.LOG_DIRECTORY)
+    if ReaderConstants.MEASUREMENT_CACHE:
+        comm_handler = MeasurementCache(comm_handler)
+    ReplHandler(comm_handler).run()
+    sys.exit()
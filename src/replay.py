@@ -0,0 +1,145 @@
+import os
+import sys
+
+import numpy as np
+
+from config import BridgeConstants, ReaderConstants
+from measurement_log import MeasurementLog
+from reader import CommunicationHandler, CompensationHandler
+
+
+class VoltageTable:
+    """
+    Class holding recorded voltage-vs-PWM points of one channel (repeated points are averaged),
+    voltage between recorded points is interpolated from the nearest ones in PWM plane (inverse distance weighting)
+    """
+    def __init__(self, pwm_left: np.ndarray, pwm_right: np.ndarray, voltage: np.ndarray,
+                 neighbours: int = ReaderConstants.REPLAY_NEIGHBOURS):
+        points = np.column_stack((pwm_left, pwm_right)).astype(np.float64)
+        self.points, inverse = np.unique(points, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        self.voltage = (np.bincount(inverse, weights=np.asarray(voltage, dtype=np.float64))
+                        / np.bincount(inverse))
+        self.neighbours = min(neighbours, len(self.points))
+
+    def get_voltage(self, pwm_left: float, pwm_right: float) -> float:
+        """
+        Get voltage of recorded point or interpolated from NEIGHBOURS nearest recorded points
+        :param: pwm_left (float)
+        :param: pwm_right (float)
+        :return: voltage
+        :rtype: float
+        """
+        distance = np.hypot(self.points[:, 0] - pwm_left, self.points[:, 1] - pwm_right)
+        nearest = np.argpartition(distance, self.neighbours - 1)[:self.neighbours]
+        if distance[nearest].min() == 0:
+            return float(self.voltage[nearest[np.argmin(distance[nearest])]])
+        weights = 1 / distance[nearest] ** 2
+        return float(np.dot(weights, self.voltage[nearest]) / weights.sum())
+
+
+class ReplayHandler:
+    """
+    Class answering messages from recorded data instead of serial port (same interface as CommunicationHandler)
+    """
+    create_message = staticmethod(CommunicationHandler.create_ascii_message)
+    parse_command = staticmethod(CommunicationHandler.parse_ascii_command)
+    create_batch_message = staticmethod(CommunicationHandler.create_batch_message)
+
+    def __init__(self, channel: np.ndarray, pwm_left: np.ndarray, pwm_right: np.ndarray, voltage: np.ndarray):
+        channel = np.asarray(channel)
+        self.tables = {}
+        for name in ReaderConstants.CHANNELS_LIST:
+            mask = channel == int(name)
+            if mask.any():
+                self.tables[name] = VoltageTable(np.asarray(pwm_left)[mask], np.asarray(pwm_right)[mask],
+                                                 np.asarray(voltage, dtype=np.float64)[mask])
+        initial_pwm = int((BridgeConstants.PWM_MIN + BridgeConstants.PWM_MAX) / 2)
+        self.pwm_values = dict.fromkeys(ReaderConstants.PWMS_LIST, initial_pwm)
+        self.pwm_channel = {pwm: channel for channel, pwms in ReaderConstants.CHANNEL_PWM_DICT.items()
+                            for pwm in pwms}
+        self.active_channel = ReaderConstants.CHOSEN_CHANNEL
+        self.round_trips = 0
+
+    @classmethod
+    def from_log(cls, directory: str = ReaderConstants.LOG_DIRECTORY):
+        """
+        Create replay from measurement log
+        :param: directory (str) directory of MeasurementLog
+        :return: replay handler
+        :rtype: ReplayHandler
+        """
+        log = MeasurementLog.read(directory)
+        return cls(log['channel'], log['pwm_left'], log['pwm_right'], log['voltage'])
+
+    @classmethod
+    def from_file(cls, path: str):
+        """
+        Create replay from CSV file with channel, pwm_left, pwm_right, voltage columns (header line skipped)
+        :param: path (str)
+        :return: replay handler
+        :rtype: ReplayHandler
+        """
+        data = np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+        return cls(data[:, 0].astype(int), data[:, 1], data[:, 2], data[:, 3])
+
+    def execute(self, message: bytes) -> float:
+        """
+        Apply message to replayed device state and get voltage
+        :param: message (bytes)
+        :return: voltage
+        :rtype: float
+        """
+        if message != ReaderConstants.GET_VOLTAGE_MSG:
+            pwm = chr(message[0])
+            self.pwm_values[pwm] = int(message[1:].rstrip(ReaderConstants.NEWLINE_B))
+            self.active_channel = self.pwm_channel[pwm]
+        pwm_left, pwm_right = ReaderConstants.CHANNEL_PWM_DICT[self.active_channel]
+        return self.tables[self.active_channel].get_voltage(self.pwm_values[pwm_left], self.pwm_values[pwm_right])
+
+    def handle_message(self, message: bytes) -> float:
+        """
+        Handle message
+        :param: message (bytes)
+        :return: replayed voltage
+        :rtype: float
+        """
+        self.round_trips += 1
+        return self.execute(message)
+
+    def handle_batch(self, messages: list) -> list:
+        """
+        Handle several messages
+        :param: messages (list)
+        :return: replayed voltages
+        :rtype: list
+        """
+        self.round_trips += 1
+        return [self.execute(message) for message in messages]
+
+    def send_message(self, message: bytes) -> None:
+        """
+        Nothing is sent during replay
+        :param: message (bytes)
+        :return: None
+        """
+
+    def close_connection(self) -> None:
+        """
+        Nothing to close during replay
+        :return: None
+        """
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else ReaderConstants.LOG_DIRECTORY
+    replay = ReplayHandler.from_log(source) if os.path.isdir(source) else ReplayHandler.from_file(source)
+    for replay_channel in replay.tables:
+        handler = CompensationHandler(replay, replay_channel, verbose=False)
+        replay.round_trips = 0
+        final_voltage = handler.find_minimum()
+        print(f'Channel number: [{replay_channel}]')
+        print(f'Final voltage: [{final_voltage}][V]')
+        print(f'PWM channel {handler.pwm_left}: [{handler.pwm1}]')
+        print(f'PWM channel {handler.pwm_right}: [{handler.pwm2}]')
+        print(f'Round-trips: [{replay.round_trips}]')
@@ -0,0 +1,289 @@
+import concurrent.futures
+import itertools
+import json
+import platform
+import sys
+import time
+
+import numpy as np
+
+from balance import BalanceSolver
+from bridge_simulator import BridgeBank
+from config import BridgeConstants, ReaderConstants, ToleranceConstants
+
+
+def limit(pwms: np.ndarray) -> np.ndarray:
+    """
+    Round positions and limit them to PWM range
+    :param: pwms (np.ndarray)
+    :return: valid PWM values
+    :rtype: np.ndarray
+    """
+    return np.clip(np.round(pwms), BridgeConstants.PWM_MIN, BridgeConstants.PWM_MAX)
+
+
+def parabola_minimum(low_pwm: np.ndarray, pwm: np.ndarray, high_pwm: np.ndarray,
+                     low: np.ndarray, mid: np.ndarray, high: np.ndarray) -> np.ndarray:
+    """
+    Fit parabola through three probes of every sample and find its minimum, as reader's StepController does
+    :param: low_pwm, pwm, high_pwm (np.ndarray) low, middle and high position
+    :param: low, mid, high (np.ndarray) voltages measured at these positions
+    :return: position of minimum, NaN where probes do not lie on convex parabola
+    :rtype: np.ndarray
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope_low = (mid - low) / (pwm - low_pwm)
+        slope_high = (high - mid) / (high_pwm - pwm)
+        curvature = (slope_high - slope_low) / (high_pwm - low_pwm)
+        vertex = (low_pwm + pwm) / 2 - slope_low / (2 * curvature)
+    return np.where((low_pwm != pwm) & (pwm != high_pwm) & (curvature > 0), vertex, np.nan)
+
+
+def update_steps(pwm: np.ndarray, low_pwm: np.ndarray, high_pwm: np.ndarray, voltages: tuple,
+                 step: np.ndarray, direction: np.ndarray) -> tuple:
+    """
+    Choose next position of one potentiometer for all samples at once and adapt steps, as reader's StepController
+    :param: pwm, low_pwm, high_pwm (np.ndarray) middle, low and high position
+    :param: voltages (tuple) voltages measured at low, middle and high position
+    :param: step (np.ndarray) current steps
+    :param: direction (np.ndarray) direction of last jump beyond probes (-1, 1), 0 if there was none
+    :return: next positions, steps and directions
+    :rtype: tuple
+    """
+    low, mid, high = voltages
+    vertex = parabola_minimum(low_pwm, pwm, high_pwm, low, mid, high)
+    known = ~np.isnan(vertex)
+    bracketed = (mid <= low) & (mid <= high)
+
+    bracketed_target = np.where(known, vertex, pwm)
+    bracketed_step = np.maximum(np.maximum(step / ReaderConstants.DIVIDER, np.abs(bracketed_target - pwm)),
+                                ReaderConstants.MIN_STEP)
+
+    edge_direction = np.where(low < high, -1, 1)
+    edge = np.where(edge_direction < 0, low_pwm, high_pwm)
+    beyond = ~known | ((vertex - edge) * edge_direction > 0)
+    edge_step = np.where(beyond & (edge_direction == direction),
+                         np.minimum(step * ReaderConstants.STEP_GROWTH, ReaderConstants.MAX_STEP), step)
+    reach = edge + edge_direction * edge_step
+    edge_target = np.clip(np.where(known, vertex, edge), np.minimum(pwm, reach), np.maximum(pwm, reach))
+
+    return (limit(np.where(bracketed, bracketed_target, edge_target)),
+            np.where(bracketed, bracketed_step, edge_step),
+            np.where(bracketed | ~beyond, 0, edge_direction))
+
+
+def compensate_chunk(components: np.ndarray, initial_pwm: tuple, step: float) -> dict:
+    """
+    Run reader compensation algorithm against every component set of chunk (run in worker process).
+    Finished samples are dropped from simulated arrays, so long searches do not slow down the rest
+    :param: components (np.ndarray) shape (samples, 5) - C, R3, R4, L, frequency
+    :param: initial_pwm (tuple) left and right PWM value where compensation starts
+    :param: step (float) initial step
+    :return: final voltage, final PWM values, iterations and round-trips of every sample
+    :rtype: dict
+    """
+    samples = len(components)
+    final_voltage = np.empty(samples)
+    final_pwms = np.empty((samples, 2))
+    iterations = np.zeros(samples, dtype=np.int64)
+
+    index = np.arange(samples)
+    simulator = BridgeBank(components)
+    pwms = np.tile(np.asarray(initial_pwm, dtype=np.float64), (samples, 1))
+    steps = np.full((samples, 2), step, dtype=np.float64)
+    directions = np.zeros((samples, 2))
+    best_voltage = simulator.get_voltage_grid(pwms)
+    best_pwms = pwms.copy()
+    pattern = np.full((samples, 2), np.nan)
+    growth = np.ones(samples)
+    for _ in range(ReaderConstants.MAX_ITERATIONS):
+        iterations[index] += 1
+        base_voltage, base_pwms = best_voltage.copy(), best_pwms.copy()
+        for axis in (0, 1):
+            # Probes (middle, low, high) and pattern point measured in one round-trip by reader
+            low_pwm = np.maximum(pwms[:, axis] - np.round(steps[:, axis]), BridgeConstants.PWM_MIN)
+            high_pwm = np.minimum(pwms[:, axis] + np.round(steps[:, axis]), BridgeConstants.PWM_MAX)
+            has_pattern = ~np.isnan(pattern[:, 0])
+            points = np.stack([pwms, pwms, pwms, np.where(has_pattern[:, np.newaxis], pattern, pwms)])
+            points[1:3, :, axis] = (low_pwm, high_pwm)
+            mid, low, high, pattern_voltage = simulator.get_voltage_grid(points)
+
+            # First of equal voltages wins, as in reader
+            candidates = np.stack([best_voltage, mid, low, high])
+            choice = np.argmin(candidates, axis=0)
+            improved = choice > 0
+            best_voltage = candidates[choice, np.arange(len(index))]
+            best_pwms[improved] = points[choice - 1, np.arange(len(index))][improved]
+
+            accepted = has_pattern & (pattern_voltage < best_voltage)
+            best_voltage = np.where(accepted, pattern_voltage, best_voltage)
+            best_pwms[accepted] = pattern[accepted]
+
+            target, new_steps, new_directions = update_steps(pwms[:, axis], low_pwm, high_pwm, (low, mid, high),
+                                                             steps[:, axis], directions[:, axis])
+            pwms[:, axis] = np.where(accepted, pwms[:, axis], target)
+            pwms[accepted] = pattern[accepted]
+            steps[:, axis] = np.where(accepted, steps[:, axis], new_steps)
+            directions[:, axis] = np.where(accepted, directions[:, axis], new_directions)
+            growth = np.where(has_pattern, np.where(accepted, growth * ReaderConstants.STEP_GROWTH, 1), growth)
+            pattern[:] = np.nan
+
+        improved = best_voltage < base_voltage
+        pattern[improved] = limit(best_pwms + growth[:, np.newaxis] * (best_pwms - base_pwms))[improved]
+        converged = np.all(steps <= ReaderConstants.MIN_STEP, axis=1)
+        # No progress with large steps - continue from best point with smaller steps
+        stuck = ~improved & ~converged
+        pwms[stuck] = best_pwms[stuck]
+        steps[stuck] = np.maximum(steps[stuck] / ReaderConstants.DIVIDER, ReaderConstants.MIN_STEP)
+        directions[stuck] = 0
+
+        active = improved | ~converged
+        if not active.all():
+            final_voltage[index[~active]] = best_voltage[~active]
+            final_pwms[index[~active]] = best_pwms[~active]
+            index, pwms, steps, directions = index[active], pwms[active], steps[active], directions[active]
+            best_voltage, best_pwms = best_voltage[active], best_pwms[active]
+            pattern, growth = pattern[active], growth[active]
+            if len(index) == 0:
+                break
+            simulator = BridgeBank(components[index])
+    final_voltage[index] = best_voltage
+    final_pwms[index] = best_pwms
+    return {
+        'voltage': final_voltage,
+        'pwm': final_pwms,
+        'iterations': iterations,
+        # Set up batch, two batches per iteration and final setting of best point
+        'round_trips': 2 + 2 * iterations
+    }
+
+
+class ToleranceAnalysis:
+    """
+    Class running Monte Carlo analysis of component tolerances - compensation is simulated for thousands
+    of randomly drawn component sets, spread over all cores (each worker simulates whole chunk at once)
+    """
+    def __init__(self, samples: int = ToleranceConstants.SAMPLES,
+                 tolerances: tuple = ToleranceConstants.TOLERANCES,
+                 seed: int = ToleranceConstants.SEED,
+                 workers: int = ToleranceConstants.WORKERS,
+                 chunk_size: int = ToleranceConstants.CHUNK_SIZE):
+        self.samples = samples
+        self.tolerances = tolerances
+        self.seed = seed
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.components = self.sample_components()
+        self.results = []
+
+    def sample_components(self) -> np.ndarray:
+        """
+        Draw component sets uniformly within tolerances around nominal values from BridgeConstants
+        :return: shape (samples, 5) - C, R3, R4, L, frequency
+        :rtype: np.ndarray
+        """
+        nominal = np.array([BridgeConstants.CAPACITANCE, BridgeConstants.RESISTANCE3, BridgeConstants.RESISTANCE4,
+                            BridgeConstants.INDUCTANCE, BridgeConstants.FREQUENCY])
+        tolerances = np.asarray(self.tolerances, dtype=np.float64)
+        rng = np.random.default_rng(self.seed)
+        return nominal * (1 + rng.uniform(-tolerances, tolerances, size=(self.samples, len(nominal))))
+
+    @staticmethod
+    def distribution(values: np.ndarray) -> dict:
+        """
+        Describe distribution of values
+        :param: values (np.ndarray)
+        :return: mean and chosen percentiles
+        :rtype: dict
+        """
+        values = np.asarray(values, dtype=np.float64)
+        description = {'mean': float(values.mean())}
+        for percentile, value in zip(ToleranceConstants.PERCENTILES,
+                                     np.percentile(values, ToleranceConstants.PERCENTILES)):
+            description[f'p{percentile:g}'] = float(value)
+        return description
+
+    def balance(self) -> dict:
+        """
+        Describe resistances needed to balance sampled bridges and how many of them are within potentiometer range
+        :return: distributions of both resistances and fraction of reachable balance points
+        :rtype: dict
+        """
+        C, R3, R4, L = self.components[:, :4].T
+        resistance1, resistance2 = BalanceSolver(C, R3, R4, L).resistances()
+        reachable = ((resistance1 >= BridgeConstants.MIN_RESISTANCE) & (resistance1 <= BridgeConstants.MAX_RESISTANCE)
+                     & (resistance2 >= BridgeConstants.MIN_RESISTANCE)
+                     & (resistance2 <= BridgeConstants.MAX_RESISTANCE))
+        return {
+            'resistance1': self.distribution(resistance1),
+            'resistance2': self.distribution(resistance2),
+            'reachable': float(reachable.mean())
+        }
+
+    def run_case(self, executor: concurrent.futures.Executor, initial_pwm, step: float) -> dict:
+        """
+        Simulate compensation of all samples from one starting point with one initial step
+        :param: executor (concurrent.futures.Executor) pool running chunks
+        :param: initial_pwm (tuple | None) starting point, None for warm start from nominal balance point
+        :param: step (float) initial step
+        :return: case description and distributions of results
+        :rtype: dict
+        """
+        start_pwm = BalanceSolver().pwms() if initial_pwm is None else initial_pwm
+        chunks = np.array_split(self.components, max(1, -(-self.samples // self.chunk_size)))
+        start = time.perf_counter()
+        parts = list(executor.map(compensate_chunk, chunks, itertools.repeat(start_pwm), itertools.repeat(step)))
+        wall_time = time.perf_counter() - start
+        results = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+        return {
+            'initial_pwm': list(initial_pwm) if initial_pwm is not None else None,
+            'step': step,
+            'wall_time': wall_time,
+            'voltage': self.distribution(results['voltage']),
+            'iterations': self.distribution(results['iterations']),
+            'round_trips': self.distribution(results['round_trips']),
+            'pinned': float(np.any((results['pwm'] <= BridgeConstants.PWM_MIN)
+                                   | (results['pwm'] >= BridgeConstants.PWM_MAX), axis=1).mean())
+        }
+
+    def run(self) -> list:
+        """
+        Run all combinations of starting points and steps from ToleranceConstants
+        :return: results of all cases
+        :rtype: list
+        """
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as executor:
+            for initial_pwm, step in itertools.product(ToleranceConstants.INITIAL_PWMS, ToleranceConstants.STEPS):
+                self.results.append(self.run_case(executor, initial_pwm, step))
+        return self.results
+
+    def save(self, path: str) -> None:
+        """
+        Save results as JSON
+        :param: path (str) output file
+        :return: None
+        """
+        report = {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'samples': self.samples,
+            'tolerances': list(self.tolerances),
+            'seed': self.seed,
+            'balance': self.balance(),
+            'results': self.results,
+        }
+        with open(path, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    output_file = sys.argv[1] if len(sys.argv) > 1 else ToleranceConstants.OUTPUT_FILE
+    analysis = ToleranceAnalysis()
+    analysis.run()
+    analysis.save(output_file)
+    print(f'Balance: {analysis.balance()}')
+    for result in analysis.results:
+        print(f'Initial PWM {result["initial_pwm"]}, step {result["step"]}: '
+              f'voltage median [{result["voltage"]["p50"]:.3g}][V] p95 [{result["voltage"]["p95"]:.3g}][V], '
+              f'round-trips median [{result["round_trips"]["p50"]:g}] p95 [{result["round_trips"]["p95"]:g}], '
+              f'pinned [{result["pinned"]:.1%}], time [{result["wall_time"]:.2f}][s]')
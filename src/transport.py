@@ -0,0 +1,263 @@
+import random
+import socket
+import time
+from collections import deque
+
+from config import BridgeConstants, ReaderConstants
+
+
+class LinkModel:
+    """
+    Class modelling serial link - transmission time at given baud rate, processing latency,
+    jitter and dropped frames
+    """
+    def __init__(self, baud_rate: int = BridgeConstants.BAUD_RATE, latency: float = BridgeConstants.LINK_LATENCY,
+                 jitter: float = BridgeConstants.LINK_JITTER, drop_rate: float = BridgeConstants.LINK_DROP_RATE,
+                 seed=None):
+        self.baud_rate = baud_rate
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.random = random.Random(seed)
+        self.dropped_frames = 0
+
+    def byte_time(self) -> float:
+        """
+        Get transmission time of one byte
+        :return: time [s]
+        :rtype: float
+        """
+        return ReaderConstants.BITS_PER_BYTE / self.baud_rate
+
+    def processing_time(self) -> float:
+        """
+        Get processing latency of one frame including random jitter
+        :return: time [s]
+        :rtype: float
+        """
+        return self.latency + self.random.uniform(0, self.jitter)
+
+    def drop(self) -> bool:
+        """
+        Decide if frame is lost
+        :return: True if frame should be dropped
+        :rtype: bool
+        """
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            self.dropped_frames += 1
+            return True
+        return False
+
+
+class InMemorySerial:
+    """
+    Serial-port-like object answering frames in process with simulator MessageHandler
+    (subset of serial.Serial interface used by reader and simulator)
+    With LinkModel responses arrive byte by byte after modelled delay: in realtime mode
+    reads wait for them (and time out like real port), otherwise only link_time is accumulated
+    """
+    def __init__(self, message_handler, link: LinkModel = None, realtime: bool = False):
+        self.message_handler = message_handler
+        self.link = link
+        self.realtime = realtime
+        self.timeout = None
+        self.input_buffer = deque()
+        self.output_buffer = bytearray()
+        self.frames = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.link_time = 0.0
+
+    @property
+    def in_waiting(self) -> int:
+        """
+        Get number of bytes which already arrived
+        :return: number of bytes
+        :rtype: int
+        """
+        now = time.monotonic()
+        return sum(1 for ready_at, _ in self.input_buffer if ready_at <= now or not self.realtime)
+
+    def write(self, data: bytes) -> int:
+        """
+        Pass data to simulator, every complete frame is answered
+        :param: data (bytes)
+        :return: number of bytes written
+        :rtype: int
+        """
+        self.bytes_sent += len(data)
+        self.output_buffer += data
+        end = self.message_handler.frame_length(self.output_buffer)
+        while end:
+            frame = bytes(self.output_buffer[:end])
+            del self.output_buffer[:end]
+            end = self.message_handler.frame_length(self.output_buffer)
+            if self.message_handler.is_quit(frame):
+                continue
+            self.frames += 1
+            try:
+                response = self.message_handler.handle(frame)
+            except Exception:
+                # Malformed frame is not answered, as by SerialServer
+                continue
+            self.queue_response(len(frame), response)
+        return len(data)
+
+    def queue_response(self, request_size: int, response: bytes) -> None:
+        """
+        Put response into input buffer with time each byte arrives
+        :param: request_size (int) size of request frame in bytes
+        :param: response (bytes)
+        :return: None
+        """
+        start = time.monotonic()
+        if self.link is None:
+            self.input_buffer.extend((start, byte) for byte in response)
+            return
+        if self.link.drop():
+            self.link_time += self.link.latency + request_size * self.link.byte_time()
+            return
+        byte_time = self.link.byte_time()
+        delay = request_size * byte_time + self.link.processing_time()
+        self.link_time += delay + len(response) * byte_time
+        if self.input_buffer:
+            start = max(start, self.input_buffer[-1][0])
+        self.input_buffer.extend((start + delay + (i + 1) * byte_time, byte) for i, byte in enumerate(response))
+
+    def read(self, size: int = 1) -> bytes:
+        """
+        Read up to size bytes of response, waiting at most timeout in realtime mode
+        :param: size (int)
+        :return: received bytes
+        :rtype: bytes
+        """
+        data = bytearray()
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while len(data) < size and self.input_buffer:
+            ready_at, byte = self.input_buffer[0]
+            if self.realtime:
+                now = time.monotonic()
+                if ready_at > now:
+                    if deadline is not None and ready_at > deadline:
+                        time.sleep(max(deadline - now, 0))
+                        break
+                    time.sleep(ready_at - now)
+            data.append(byte)
+            self.input_buffer.popleft()
+        if self.realtime and len(data) < size and not self.input_buffer and deadline is not None:
+            time.sleep(max(deadline - time.monotonic(), 0))
+        self.bytes_received += len(data)
+        return bytes(data)
+
+    def read_until(self, expected: bytes = ReaderConstants.NEWLINE_B) -> bytes:
+        """
+        Read until expected bytes or end of buffered data
+        :param: expected (bytes)
+        :return: received bytes
+        :rtype: bytes
+        """
+        data = bytearray()
+        while not data.endswith(expected):
+            byte = self.read(1)
+            if not byte:
+                break
+            data += byte
+        return bytes(data)
+
+    def reset_input_buffer(self) -> None:
+        """
+        Drop bytes which already arrived (bytes still in transmission will arrive later, as on real port)
+        :return: None
+        """
+        if not self.realtime:
+            self.input_buffer.clear()
+            return
+        now = time.monotonic()
+        while self.input_buffer and self.input_buffer[0][0] <= now:
+            self.input_buffer.popleft()
+
+    def reset_output_buffer(self) -> None:
+        """
+        Nothing to drop, frames are passed to simulator on write
+        :return: None
+        """
+
+    def close(self) -> None:
+        """
+        Nothing to close
+        :return: None
+        """
+
+
+class SocketSerial:
+    """
+    Serial-port-like object connected to broker over Unix socket
+    (subset of serial.Serial interface used by reader)
+    """
+    def __init__(self, path: str = ReaderConstants.BROKER_SOCKET):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.connect(path)
+        self.timeout = None
+
+    def write(self, data: bytes) -> int:
+        """
+        Send data to broker
+        :param: data (bytes)
+        :return: number of bytes written
+        :rtype: int
+        """
+        self.socket.sendall(data)
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        """
+        Read up to size bytes, waiting at most timeout for all of them
+        :param: size (int)
+        :return: received bytes
+        :rtype: bytes
+        """
+        data = bytearray()
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while len(data) < size:
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.socket.settimeout(remaining)
+            else:
+                self.socket.settimeout(None)
+            try:
+                chunk = self.socket.recv(size - len(data))
+            except socket.timeout:
+                break
+            if not chunk:
+                break
+            data += chunk
+        return bytes(data)
+
+    def reset_input_buffer(self) -> None:
+        """
+        Drop bytes which already arrived (e.g. late response to timed out request)
+        :return: None
+        """
+        self.socket.setblocking(False)
+        try:
+            while self.socket.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        finally:
+            self.socket.setblocking(True)
+
+    def reset_output_buffer(self) -> None:
+        """
+        Nothing to drop, data is sent on write
+        :return: None
+        """
+
+    def close(self) -> None:
+        """
+        Disconnect from broker
+        :return: None
+        """
+        self.socket.close()
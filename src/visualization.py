@@ -0,0 +1,260 @@
+import multiprocessing
+import os
+import queue
+import sys
+
+from config import BridgeConstants, ReaderConstants, VisualizationConstants
+from instrumentation import METRICS
+
+# matplotlib and NumPy are imported in worker process only, so control loop never pays for them
+
+
+class PathRecorder:
+    """
+    Class collecting measurements of communication handler (attached as its log, same interface
+    as MeasurementLog) into paths of every channel - measured points in order they were taken.
+    Measurements can be passed on to another log
+    """
+    def __init__(self, log=None):
+        self.log = log
+        self.paths = {}
+
+    def append(self, channel: str, pwm_left: int, pwm_right: int, voltage: float) -> None:
+        """
+        Add measurement to path of channel
+        :param: channel (str)
+        :param: pwm_left (int)
+        :param: pwm_right (int)
+        :param: voltage (float)
+        :return: None
+        """
+        self.paths.setdefault(channel, []).append((pwm_left, pwm_right, voltage))
+        if self.log is not None:
+            self.log.append(channel, pwm_left, pwm_right, voltage)
+
+    def take(self, channel: str) -> list:
+        """
+        Take recorded path of channel and start new one
+        :param: channel (str)
+        :return: measured points (left PWM value, right PWM value, voltage)
+        :rtype: list
+        """
+        return self.paths.pop(channel, [])
+
+    def close(self) -> None:
+        """
+        Close log measurements are passed on to
+        :return: None
+        """
+        if self.log is not None:
+            self.log.close()
+
+
+class SurfacePlot:
+    """
+    Class holding data of one plot - bridge components (surface is computed by worker) and compensation path
+    """
+    def __init__(self, file_name: str, title: str, path: list, components: tuple = None, start: tuple = None):
+        """
+        :param: file_name (str) PNG file name within output directory
+        :param: title (str)
+        :param: path (list) measured points (left PWM value, right PWM value, voltage)
+        :param: components (tuple) C, R3, R4, L, frequency of bridge, None to plot path only (real bridge)
+        :param: start (tuple) initial left and right PWM value of compensation, None if unknown
+        """
+        self.file_name = file_name
+        self.title = title
+        self.path = path
+        self.components = components
+        self.start = start
+
+    @staticmethod
+    def best_path(path: list) -> list:
+        """
+        Get points where lowest voltage measured so far decreased
+        :param: path (list) measured points
+        :return: points of path which improved voltage
+        :rtype: list
+        """
+        best = []
+        for point in path:
+            if not best or point[2] < best[-1][2]:
+                best.append(point)
+        return best
+
+    def render(self, directory: str) -> str:
+        """
+        Render |V| surface with compensation path and convergence trace into PNG (run in worker process)
+        :param: directory (str) output directory
+        :return: path of written file
+        :rtype: str
+        """
+        import numpy as np
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.colors import LogNorm
+        from matplotlib.figure import Figure
+
+        figure = Figure(figsize=VisualizationConstants.FIGURE_SIZE)
+        FigureCanvasAgg(figure)
+        surface_axes, trace_axes = figure.subplots(1, 2, gridspec_kw={'width_ratios': (1.2, 1)})
+        path = np.asarray(self.path, dtype=np.float64).reshape(-1, 3)
+        best = np.asarray(self.best_path(self.path), dtype=np.float64).reshape(-1, 3)
+
+        if self.components is not None:
+            from bridge_simulator import BridgeBank
+            pwms = np.arange(BridgeConstants.PWM_MIN, BridgeConstants.PWM_MAX + 1, VisualizationConstants.GRID_STEP)
+            # Rows of surface are right PWM values (y axis), columns left PWM values (x axis)
+            surface = BridgeBank([self.components]).get_channel_voltage_grid(
+                0, pwms[np.newaxis, :], pwms[:, np.newaxis])
+            surface = np.maximum(surface, VisualizationConstants.VOLTAGE_FLOOR)
+            norm = LogNorm(vmin=surface.min(), vmax=surface.max())
+            mesh = surface_axes.pcolormesh(pwms, pwms, surface, norm=norm, cmap='viridis', shading='auto')
+            surface_axes.contour(pwms, pwms, surface, norm=norm, colors='white', linewidths=0.4, alpha=0.6,
+                                 levels=np.geomspace(surface.min(), surface.max(),
+                                                     VisualizationConstants.CONTOUR_LEVELS))
+            figure.colorbar(mesh, ax=surface_axes, label='|V| [V]')
+        if len(path):
+            surface_axes.scatter(path[:, 0], path[:, 1], s=4, color='lightgrey', alpha=0.7, label='Measurements')
+            surface_axes.plot(best[:, 0], best[:, 1], '.-', color='tab:red', linewidth=1, label='Best point')
+            # First measured point has only one potentiometer moved, it is not where compensation started
+            if self.start is not None:
+                surface_axes.plot(*self.start, 'o', color='tab:orange', label='Start')
+            surface_axes.plot(*best[-1, :2], '*', color='tab:red', markersize=12, label='Result')
+            surface_axes.legend(loc='lower right', fontsize='small')
+        surface_axes.set_xlim(BridgeConstants.PWM_MIN, BridgeConstants.PWM_MAX)
+        surface_axes.set_ylim(BridgeConstants.PWM_MIN, BridgeConstants.PWM_MAX)
+        surface_axes.set_xlabel('PWM left')
+        surface_axes.set_ylabel('PWM right')
+        surface_axes.set_title('Voltage surface and compensation path')
+
+        if len(path):
+            measurements = np.arange(1, len(path) + 1)
+            trace_axes.semilogy(measurements, path[:, 2], color='lightgrey', linewidth=0.8, label='Measured')
+            trace_axes.semilogy(measurements, np.minimum.accumulate(path[:, 2]), color='tab:red', label='Best')
+            trace_axes.legend(loc='upper right', fontsize='small')
+        trace_axes.set_xlabel('Measurement')
+        trace_axes.set_ylabel('|V| [V]')
+        trace_axes.set_title('Convergence')
+        trace_axes.grid(True, which='both', alpha=0.3)
+
+        if len(path):
+            figure.suptitle(f'{self.title}, final [{best[-1, 2]:.3g}][V] at ({best[-1, 0]:.0f}, {best[-1, 1]:.0f})')
+        else:
+            figure.suptitle(self.title)
+        figure.tight_layout()
+        output_path = os.path.join(directory, self.file_name)
+        figure.savefig(output_path, dpi=VisualizationConstants.DPI)
+        return output_path
+
+
+class PlotWorker:
+    """
+    Class rendering plots in separate process fed by queue - control loop only puts plot data into queue
+    (never waits for rendering, when queue is full plot is dropped or submit waits for free slot, as chosen
+    by caller). Worker renders headlessly (Agg backend)
+    """
+    def __init__(self, directory: str = VisualizationConstants.OUTPUT_DIRECTORY,
+                 queue_size: int = VisualizationConstants.QUEUE_SIZE):
+        # Fresh interpreter - worker does not inherit threads or serial port of control process
+        context = multiprocessing.get_context('spawn')
+        self.plots = context.Queue(queue_size)
+        self.process = context.Process(target=self.worker_function, args=(self.plots, directory), daemon=True)
+        self.submitted = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        """
+        Start worker process
+        :return: None
+        """
+        self.process.start()
+
+    def submit(self, plot: SurfacePlot, block: bool = False) -> bool:
+        """
+        Queue plot for rendering
+        :param: plot (SurfacePlot)
+        :param: block (bool) wait for free slot when queue is full instead of dropping plot
+        :return: False if queue was full and plot was dropped
+        :rtype: bool
+        """
+        try:
+            self.plots.put(plot, block)
+        except queue.Full:
+            self.dropped += 1
+            METRICS.count('visualization.dropped')
+            return False
+        self.submitted += 1
+        return True
+
+    @staticmethod
+    def worker_function(plots, directory: str) -> None:
+        """
+        Render queued plots until None is received, run as a process
+        :param: plots (multiprocessing.Queue) plots to render
+        :param: directory (str) output directory
+        :return: None
+        """
+        import matplotlib
+        matplotlib.use('Agg')
+        os.makedirs(directory, exist_ok=True)
+        while True:
+            plot = plots.get()
+            if plot is None:
+                break
+            try:
+                print(f'Plot: [{plot.render(directory)}]')
+            except Exception as error:
+                # One bad plot must not stop rendering of the rest
+                print(f'Plot {plot.file_name} failed: {error!r}', file=sys.stderr)
+
+    def stop(self, timeout: float = None) -> None:
+        """
+        Let worker render remaining plots and stop it
+        :param: timeout (float) [s] time to wait for worker, None to wait until all plots are rendered
+        :return: None
+        """
+        self.plots.put(None)
+        self.process.join(timeout)
+
+
+def compensation_plots(worker: PlotWorker) -> None:
+    """
+    Compensate every channel of simulator with nominal components and channel tolerances from every starting
+    point of VisualizationConstants (against in-process simulator) and submit surface plot of every run
+    (no plot is dropped, compensation waits for worker when queue is full)
+    :param: worker (PlotWorker)
+    :return: None
+    """
+    from bridge_simulator import MessageHandler, MultiBridgeSimulator
+    from reader import CommunicationHandler, CompensationHandler
+    from transport import InMemorySerial
+
+    simulator = MultiBridgeSimulator.from_constants()
+    comm = CommunicationHandler(InMemorySerial(MessageHandler(simulator)))
+    recorder = PathRecorder()
+    comm.log = recorder
+    for channel_index, channel in enumerate(simulator.channels):
+        components = (simulator.C[channel_index], simulator.R3[channel_index], simulator.R4[channel_index],
+                      simulator.L[channel_index], simulator.frequency[channel_index])
+        for initial_pwm in VisualizationConstants.INITIAL_PWMS:
+            handler = CompensationHandler(comm, channel, verbose=False)
+            if initial_pwm is None:
+                initial, start = handler.initial_position(), 'warm'
+            else:
+                initial, start = (*initial_pwm, ReaderConstants.STEP1), '%d_%d' % initial_pwm
+            recorder.take(channel)
+            handler.find_minimum(initial)
+            path = recorder.take(channel)
+            worker.submit(SurfacePlot(f'channel_{channel}_{start}.png',
+                                      f'Channel {channel}, start {start}: [{len(path)}] measurements',
+                                      path, components, initial[:2]), block=True)
+
+
+if __name__ == '__main__':
+    output_directory = sys.argv[1] if len(sys.argv) > 1 else VisualizationConstants.OUTPUT_DIRECTORY
+    plot_worker = PlotWorker(output_directory)
+    plot_worker.start()
+    compensation_plots(plot_worker)
+    plot_worker.stop()
+    print(f'Plots: [{plot_worker.submitted}] submitted to {output_directory}, [{plot_worker.dropped}] dropped')
+    sys.exit()
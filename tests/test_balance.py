@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+from balance import BalanceSolver
+from bridge_simulator import BridgeBank
+from config import BridgeConstants
+
+
+def test_resistances_balance_bridge():
+    solver = BalanceSolver(capacitance=1e-6, resistance3=2, resistance4=1, inductance=1e-3)
+    assert solver.resistances() == pytest.approx((1000, 500))
+
+
+def test_resistance_to_pwm_limits():
+    assert BalanceSolver.resistance_to_pwm(BridgeConstants.MIN_RESISTANCE) == BridgeConstants.PWM_MIN
+    assert BalanceSolver.resistance_to_pwm(BridgeConstants.MAX_RESISTANCE) == BridgeConstants.PWM_MAX
+    assert BalanceSolver.resistance_to_pwm(0) == BridgeConstants.PWM_MIN
+    assert BalanceSolver.resistance_to_pwm(1e9) == BridgeConstants.PWM_MAX
+
+
+def test_pwms_are_minimum_of_simulated_bridge():
+    components = (1e-6, 2, 1, 1e-3, BridgeConstants.FREQUENCY)
+    pwm1, pwm2 = BalanceSolver(*components[:4]).pwms()
+    bank = BridgeBank([components])
+    offsets = np.array([-20, 0, 20])
+    grid = bank.get_channel_voltage_grid(0, pwm1 + offsets[np.newaxis, :], pwm2 + offsets[:, np.newaxis])
+    assert grid.argmin() == grid.size // 2
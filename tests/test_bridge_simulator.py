@@ -0,0 +1,54 @@
+import struct
+
+import pytest
+
+from bridge_simulator import MessageHandler, MultiBridgeSimulator, SerialServer
+from config import ReaderConstants
+
+
+class ScriptedPort:
+    """
+    Serial-port-like object delivering given frames one by one to SerialServer (quit message after the last one)
+    and collecting its responses
+    """
+    def __init__(self, frames: list):
+        self.frames = list(frames) + [b'q\n']
+        self.timeout = None
+        self.responses = []
+        self.closed = False
+
+    def read_until(self, expected: bytes = ReaderConstants.NEWLINE_B) -> bytes:
+        return self.frames.pop(0)
+
+    def write(self, data: bytes) -> int:
+        self.responses.append(data)
+        return len(data)
+
+    def reset_input_buffer(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_set_pwm_rejects_unknown_name():
+    simulator = MultiBridgeSimulator.from_constants()
+    with pytest.raises(ValueError):
+        simulator.set_pwm('Z', 4500)
+
+
+def test_components_of_every_channel_required():
+    with pytest.raises(ValueError):
+        MultiBridgeSimulator([(1e-9, 50, 50, 1e-3, 1e3)])
+
+
+def test_server_survives_malformed_frames():
+    simulator = MultiBridgeSimulator.from_constants()
+    port = ScriptedPort([b'Z4500\n', b'A45x0\n', b'A3000\n'])
+    server = SerialServer(port, MessageHandler(simulator))
+    server.serve()
+    assert server.malformed_frames == 2
+    assert port.closed
+    assert len(port.responses) == 1
+    assert struct.unpack('!f', port.responses[0])[0] == pytest.approx(simulator.get_voltage('1'), rel=1e-6)
+    assert simulator.pwms[0][0] == 3000
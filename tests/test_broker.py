@@ -0,0 +1,57 @@
+import math
+
+import pytest
+
+from bridge_simulator import MessageHandler, MultiBridgeSimulator
+from broker import Broker, BrokerRequest
+from config import ReaderConstants
+from reader import CommunicationHandler
+from transport import InMemorySerial
+
+
+@pytest.fixture
+def broker():
+    port = InMemorySerial(MessageHandler(MultiBridgeSimulator.from_constants()))
+    return Broker(CommunicationHandler(port))
+
+
+def test_valid_message():
+    assert Broker.valid_message(b'A4500\n')
+    assert Broker.valid_message(ReaderConstants.GET_VOLTAGE_MSG)
+    assert not Broker.valid_message(b'Z4500\n')
+    assert not Broker.valid_message(b'A45x0\n')
+    assert not Broker.valid_message(b'A4500')
+    assert not Broker.valid_message(b'A\n')
+
+
+def test_merge_answers_reads_with_preceding_command(broker):
+    pending = [BrokerRequest([ReaderConstants.GET_VOLTAGE_MSG]),
+               BrokerRequest([b'A3000\n', b'B5000\n']),
+               BrokerRequest([ReaderConstants.GET_VOLTAGE_MSG])]
+    messages, sources = broker.merge(pending)
+    assert messages == [ReaderConstants.GET_VOLTAGE_MSG, b'A3000\n', b'B5000\n']
+    assert sources == [0, 1, 2, 2]
+    assert broker.merged_reads == 1
+
+
+def test_execute_answers_every_request(broker):
+    pending = [BrokerRequest([b'A3000\n', b'B5000\n']), BrokerRequest([ReaderConstants.GET_VOLTAGE_MSG])]
+    broker.execute(pending)
+    assert all(request.done.is_set() for request in pending)
+    assert pending[1].voltages == [pending[0].voltages[-1]]
+    assert broker.round_trips == 1
+
+
+def test_submit_through_running_broker(broker):
+    broker.start()
+    try:
+        voltages = broker.submit([b'C3000\n', ReaderConstants.GET_VOLTAGE_MSG], timeout=5)
+    finally:
+        broker.stop()
+    assert len(voltages) == 2 and voltages[0] == voltages[1]
+
+
+def test_reject_answers_nan(broker):
+    voltages = broker.reject([b'Z4500\n', ReaderConstants.GET_VOLTAGE_MSG])
+    assert len(voltages) == 2 and all(math.isnan(voltage) for voltage in voltages)
+    assert broker.stats()['rejected_requests'] == 1
@@ -0,0 +1,65 @@
+import pytest
+
+from bridge_simulator import MessageHandler, MultiBridgeSimulator
+from measurement_cache import MeasurementCache
+from reader import CommunicationHandler
+from transport import InMemorySerial
+
+
+@pytest.fixture
+def cache():
+    port = InMemorySerial(MessageHandler(MultiBridgeSimulator.from_constants()))
+    return MeasurementCache(CommunicationHandler(port))
+
+
+def probe(cache: MeasurementCache, pwm1: int, pwm2: int) -> list:
+    """
+    Set both PWMs of channel 1 and read voltages
+    :param: cache (MeasurementCache)
+    :param: pwm1 (int) left PWM value
+    :param: pwm2 (int) right PWM value
+    :return: voltages
+    :rtype: list
+    """
+    return cache.handle_batch([cache.create_message('A', pwm1), cache.create_message('B', pwm2)])
+
+
+def test_repeated_probe_is_answered_from_cache(cache):
+    first = probe(cache, 3000, 5000)
+    assert probe(cache, 3000, 5000)[-1] == first[-1]
+    assert cache.round_trips == 1
+    assert cache.hits == 2
+
+
+def test_revisited_point_is_answered_from_cache(cache):
+    first = probe(cache, 3000, 5000)
+    probe(cache, 3100, 5000)
+    hits = cache.hits
+    assert probe(cache, 3000, 5000)[-1] == first[-1]
+    assert cache.hits > hits
+    # Device is still moved back to requested point
+    assert list(cache.comm.serial_port.message_handler.pwm.pwms[0]) == [3000, 5000]
+
+
+def test_unchanged_pwm_is_not_resent(cache):
+    probe(cache, 3000, 5000)
+    frames = cache.comm.serial_port.frames
+    voltages = probe(cache, 3000, 5100)
+    assert cache.round_trips == 2
+    assert cache.comm.serial_port.frames == frames + 1
+    # Only B is sent, A is already set on device
+    assert cache.saved_messages == 1
+    assert voltages[-1] == pytest.approx(cache.comm.serial_port.message_handler.pwm.get_voltage('1'), rel=1e-6)
+
+
+def test_expired_measurement_is_repeated(cache):
+    cache.max_age = 0
+    probe(cache, 3000, 5000)
+    probe(cache, 3000, 5000)
+    assert cache.round_trips == 2
+
+
+def test_send_message_forgets_device_state(cache):
+    probe(cache, 3000, 5000)
+    cache.send_message(b'v\n')
+    assert all(value is None for value in cache.device_pwms.values())
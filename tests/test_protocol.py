@@ -0,0 +1,83 @@
+import struct
+
+import pytest
+
+from bridge_simulator import MessageHandler, MultiBridgeSimulator
+from config import ReaderConstants
+from protocol import BinaryProtocol
+from reader import CommunicationHandler
+from transport import InMemorySerial
+
+
+def connect(binary: bool, monkeypatch) -> tuple:
+    """
+    Connect reader to in-process simulator
+    :param: binary (bool) negotiate binary protocol
+    :return: simulator, port and communication handler
+    :rtype: tuple
+    """
+    monkeypatch.setattr(ReaderConstants, 'BINARY_PROTOCOL', binary)
+    simulator = MultiBridgeSimulator.from_constants()
+    port = InMemorySerial(MessageHandler(simulator))
+    return simulator, port, CommunicationHandler(port)
+
+
+def test_encode_decode_round_trip():
+    for opcode, value in ((ord('A'), 2000), (ord('H'), 7000), (BinaryProtocol.VOLTAGE, 0), (BinaryProtocol.BATCH, 3)):
+        frame = BinaryProtocol.encode(opcode, value)
+        assert len(frame) == BinaryProtocol.SIZE
+        assert BinaryProtocol.decode(frame) == (opcode, value)
+
+
+def test_decode_rejects_wrong_checksum():
+    frame = bytearray(BinaryProtocol.encode(ord('A'), 4500))
+    frame[-1] ^= 0xFF
+    with pytest.raises(ValueError):
+        BinaryProtocol.decode(bytes(frame))
+
+
+def test_from_ascii():
+    assert BinaryProtocol.from_ascii(b'C4321\n') == BinaryProtocol.encode(ord('C'), 4321)
+    assert BinaryProtocol.from_ascii(ReaderConstants.GET_VOLTAGE_MSG) == BinaryProtocol.encode(BinaryProtocol.VOLTAGE)
+
+
+def test_batch_frame_length():
+    frames = [BinaryProtocol.encode(ord('A'), 3000), BinaryProtocol.encode(ord('B'), 4000)]
+    batch = BinaryProtocol.batch(frames)
+    assert BinaryProtocol.decode(batch[:BinaryProtocol.SIZE]) == (BinaryProtocol.BATCH, 2)
+    assert BinaryProtocol.frame_length(batch) == len(batch) == 3 * BinaryProtocol.SIZE
+    assert BinaryProtocol.frame_length(batch[:-1]) == 0
+    assert BinaryProtocol.frame_length(frames[0] + frames[1]) == BinaryProtocol.SIZE
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_messages_in_negotiated_protocol(binary, monkeypatch):
+    simulator, port, comm = connect(binary, monkeypatch)
+    assert comm.binary == binary
+    message = comm.create_message('C', 3456)
+    if binary:
+        assert message == BinaryProtocol.encode(ord('C'), 3456)
+    else:
+        assert message == b'C3456\n'
+    assert comm.parse_command(message) == ('C', 3456)
+    voltage_message = BinaryProtocol.encode(BinaryProtocol.VOLTAGE) if binary else ReaderConstants.GET_VOLTAGE_MSG
+    assert comm.parse_command(voltage_message) == (None, None)
+
+
+@pytest.mark.parametrize('binary', [False, True])
+def test_batch_sets_simulator(binary, monkeypatch):
+    simulator, port, comm = connect(binary, monkeypatch)
+    voltages = comm.handle_batch([comm.create_message('E', 3100), comm.create_message('F', 6900)])
+    assert len(voltages) == 2
+    assert list(simulator.pwms[2]) == [3100, 6900]
+    assert voltages[-1] == pytest.approx(simulator.get_voltage('3'), rel=1e-6)
+    # One batch frame (after negotiation frame in binary mode)
+    assert port.frames == 1 + binary
+
+
+def test_simulator_answers_ascii_batch():
+    simulator = MultiBridgeSimulator.from_constants()
+    response = MessageHandler(simulator).handle(b'*A3000;B5000;v\n')
+    voltages = struct.unpack('!3f', response)
+    assert list(simulator.pwms[0]) == [3000, 5000]
+    assert voltages[1] == voltages[2] == pytest.approx(simulator.get_voltage('1'), rel=1e-6)
@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from bridge_simulator import MessageHandler, MultiBridgeSimulator
+from config import BridgeConstants, ReaderConstants, Results
+from reader import CommunicationHandler, CompensationHandler, StepController, ThreadHandler
+from transport import InMemorySerial
+
+
+class FailingMessageHandler(MessageHandler):
+    """
+    Simulator message handler which does not answer frames setting chosen PWM (as disconnected channel)
+    """
+    def __init__(self, pwm_handle, failing_pwm: str):
+        super().__init__(pwm_handle)
+        self.failing_pwm = failing_pwm.encode('utf-8')
+
+    def handle(self, frame: bytes) -> bytes:
+        if self.failing_pwm in frame:
+            raise ValueError('Channel not connected')
+        return super().handle(frame)
+
+
+@pytest.fixture
+def results(monkeypatch):
+    for name in ('PWM_VALUES', 'RESULTS', 'RESULT_VOLTAGE'):
+        monkeypatch.setattr(Results, name, dict.fromkeys(getattr(Results, name)))
+    return Results
+
+
+def test_parabola_minimum():
+    voltages = tuple((pwm - 2.5) ** 2 for pwm in (1, 2, 3))
+    assert StepController.parabola_minimum((1, 2, 3), voltages) == pytest.approx(2.5)
+    assert StepController.parabola_minimum((1, 2, 3), (1, 2, 1)) is None
+    assert StepController.parabola_minimum((2, 2, 3), voltages) is None
+
+
+def test_update_jumps_to_bracketed_minimum():
+    controller = StepController(100)
+    voltages = tuple((pwm - 4020) ** 2 for pwm in (3900, 4000, 4100))
+    assert controller.update(4000, 3900, 4100, voltages) == 4020
+    assert controller.step == 100 / ReaderConstants.DIVIDER
+    assert controller.direction == 0
+
+
+def test_update_grows_step_on_steady_slope():
+    controller = StepController(100)
+    voltages = (3.0, 2.0, 1.0)
+    assert controller.update(4000, 3900, 4100, voltages) == 4100
+    assert controller.step == 100 and controller.direction == 1
+    assert controller.update(4100, 4000, 4200, voltages) == 4200
+    assert controller.step == 100 * ReaderConstants.STEP_GROWTH
+
+
+def test_probe_positions_are_limited():
+    controller = StepController(300)
+    assert controller.probe_positions(BridgeConstants.PWM_MIN + 100) == (BridgeConstants.PWM_MIN,
+                                                                         BridgeConstants.PWM_MIN + 400)
+    assert controller.probe_positions(BridgeConstants.PWM_MAX)[1] == BridgeConstants.PWM_MAX
+
+
+def test_stopped_search_returns_initial_point():
+    port = InMemorySerial(MessageHandler(MultiBridgeSimulator.from_constants()))
+    stop_event = threading.Event()
+    stop_event.set()
+    handler = CompensationHandler(CommunicationHandler(port), '1', verbose=False, stop_event=stop_event)
+    handler.find_minimum((3000, 5000, 100))
+    assert (handler.pwm1, handler.pwm2) == (3000, 5000)
+    # Initial point and final measurement only
+    assert port.frames == 2
+
+
+def test_thread_survives_failed_channel(results, monkeypatch):
+    monkeypatch.setattr(ReaderConstants, 'READ_TIMEOUT', 0)
+    simulator = MultiBridgeSimulator.from_constants()
+    port = InMemorySerial(FailingMessageHandler(simulator, ReaderConstants.CHANNEL_PWM_DICT['2'][0]))
+    thread_handler = ThreadHandler(CommunicationHandler(port), period=3600, verbose=False)
+    deadline = time.monotonic() + 30
+    while results.RESULT_VOLTAGE['4'] is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    thread_handler.stop()
+    assert thread_handler.failed_checks == 1
+    assert results.RESULT_VOLTAGE['2'] is None
+    assert all(results.RESULT_VOLTAGE[channel] is not None for channel in ('1', '3', '4'))
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from config import ReaderConstants
+from reader import CompensationHandler
+from replay import ReplayHandler, VoltageTable
+
+
+def test_recorded_point_is_exact():
+    table = VoltageTable(np.array([3000, 3000, 3100]), np.array([5000, 5000, 5000]), np.array([1.0, 3.0, 5.0]))
+    # Repeated points are averaged
+    assert table.get_voltage(3000, 5000) == 2.0
+    assert table.get_voltage(3100, 5000) == 5.0
+
+
+def test_voltage_is_interpolated_in_both_axes():
+    pwm_left, pwm_right = np.array([3000, 3100, 3000, 3100]), np.array([5000, 5000, 5100, 5100])
+    table = VoltageTable(pwm_left, pwm_right, np.array([1.0, 2.0, 3.0, 4.0]))
+    assert table.get_voltage(3050, 5050) == pytest.approx(2.5)
+    # Closer to recorded point, closer to its voltage
+    assert 1.0 < table.get_voltage(3010, 5005) < table.get_voltage(3050, 5050)
+    assert VoltageTable(pwm_left, pwm_right, np.array([1.0, 2.0, 3.0, 4.0]), neighbours=1) \
+        .get_voltage(3090, 5090) == 4.0
+
+
+def test_replay_keeps_chosen_channel():
+    pwms = np.arange(3000, 3200, 10)
+    channel = np.full(len(pwms), 2)
+    replay = ReplayHandler(channel, pwms, pwms[::-1], np.linspace(1, 2, len(pwms)))
+    chosen_channel = ReaderConstants.CHOSEN_CHANNEL
+    handler = CompensationHandler(replay, '2', verbose=False)
+    voltage = handler.find_minimum((3100, 3100, 10))
+    assert replay.active_channel == '2'
+    assert ReaderConstants.CHOSEN_CHANNEL == chosen_channel
+    assert voltage == replay.tables['2'].get_voltage(handler.pwm1, handler.pwm2)
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from bridge_simulator import BridgeBank, MessageHandler, MultiBridgeSimulator
+from config import BridgeConstants, ReaderConstants
+from reader import CommunicationHandler, CompensationHandler, StepController
+from tolerance_analysis import ToleranceAnalysis, compensate_chunk, update_steps
+from transport import InMemorySerial
+
+
+def reader_compensation(components: tuple, initial: tuple) -> tuple:
+    """
+    Run reader compensation of one bridge against in-process simulator
+    :param: components (tuple) C, R3, R4, L, frequency
+    :param: initial (tuple) left PWM value, right PWM value and step
+    :return: final PWM values and round-trips
+    :rtype: tuple
+    """
+    nominal = np.array([BridgeConstants.CAPACITANCE, BridgeConstants.RESISTANCE3, BridgeConstants.RESISTANCE4,
+                        BridgeConstants.INDUCTANCE, BridgeConstants.FREQUENCY])
+    simulator = MultiBridgeSimulator([components] + [nominal] * (len(ReaderConstants.CHANNELS_LIST) - 1))
+    port = InMemorySerial(MessageHandler(simulator))
+    handler = CompensationHandler(CommunicationHandler(port), ReaderConstants.CHANNELS_LIST[0], verbose=False)
+    handler.find_minimum(initial)
+    return (handler.pwm1, handler.pwm2), port.frames
+
+
+@pytest.mark.parametrize('initial_pwm, step', [((4500, 4500), 500), ((4500, 4500), 10), ((2000, 7000), 50)])
+def test_compensate_chunk_matches_reader(initial_pwm, step):
+    components = ToleranceAnalysis(samples=20, seed=1).components
+    results = compensate_chunk(components, initial_pwm, step)
+    for sample, sample_components in enumerate(components):
+        pwms, round_trips = reader_compensation(tuple(sample_components), (*initial_pwm, step))
+        assert pwms == tuple(results['pwm'][sample].astype(int))
+        assert round_trips == results['round_trips'][sample]
+
+
+def test_update_steps_matches_step_controller():
+    generator = np.random.default_rng(0)
+    for _ in range(500):
+        step = float(generator.choice([1, 3, 10, 50, 400]))
+        direction = int(generator.choice([-1, 0, 1]))
+        pwm = int(generator.integers(BridgeConstants.PWM_MIN, BridgeConstants.PWM_MAX + 1))
+        controller = StepController(step)
+        controller.direction = direction
+        low_pwm, high_pwm = controller.probe_positions(pwm)
+        voltages = tuple(generator.random(3))
+        target = controller.update(pwm, low_pwm, high_pwm, voltages)
+        targets, steps, directions = update_steps(np.array([pwm]), np.array([low_pwm]), np.array([high_pwm]),
+                                                  tuple(np.array([voltage]) for voltage in voltages),
+                                                  np.array([step]), np.array([direction]))
+        assert (target, controller.step, controller.direction) == (targets[0], steps[0], directions[0])
+
+
+def test_bridge_bank_any_number_of_bridges():
+    components = ToleranceAnalysis(samples=7, seed=2).components
+    bank = BridgeBank(components)
+    pwms = np.full((len(components), 2), 4500)
+    assert bank.get_voltage_grid(pwms).shape == (7,)
+    assert bank.get_channel_voltage_grid(3, 4500, 4500) == pytest.approx(bank.get_voltage_grid(pwms)[3])